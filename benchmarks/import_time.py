@@ -0,0 +1,83 @@
+"""
+Check that importing tempoweave stays fast.
+
+    python benchmarks/import_time.py                 # fail if over budget
+    python benchmarks/import_time.py --budget 0.5    # set the budget, in seconds
+
+Each check imports modules in a fresh interpreter under -X importtime. It fails if the
+import takes longer than the budget, or if a slow dependency that should only load on
+demand (such as librosa, numba or yt_dlp) was pulled in.
+"""
+import argparse
+import json
+import subprocess
+import sys
+
+LAZY_DEPENDENCIES = ("librosa", "numba", "yt_dlp")
+
+# (modules to import, budget in seconds, dependencies they must not load). Modules which
+# talk to Spotify still need spotipy, and spotipy loads cryptography through redis.
+CHECKS: dict[str, tuple[tuple[str, ...], float, tuple[str, ...]]] = {
+    "cli": (("tempoplay.cli",), 0.1, (*LAZY_DEPENDENCIES, "numpy", "spotipy")),
+    "schema": (("tempoplay.schema", "tempoplay.schedule"), 0.5, (*LAZY_DEPENDENCIES, "numpy", "cryptography")),
+    "fetch": (("tempoplay.fetch", "tempoplay.secrets", "tempoplay.sync"), 1.5, LAZY_DEPENDENCIES),
+}
+
+
+def measure(modules: tuple[str, ...]) -> tuple[float, list[tuple[float, str]], set[str]]:
+    """Import modules in a fresh interpreter, returning (seconds, slowest imports, loaded modules)."""
+    code = f"import sys, json\nimport {', '.join(modules)}\nprint(json.dumps(sorted(sys.modules)))"
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", code], capture_output=True, text=True, check=True)
+    top_level: list[tuple[float, str]] = []
+    seconds = 0.0
+
+    # Lines look like "import time:   self [us] | cumulative | imported package".
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+
+        _, cumulative, package = line.removeprefix("import time:").split("|")
+
+        # Nested imports are indented, only the requested modules add up to the total.
+        if package.startswith("  "):
+            continue
+
+        top_level.append((int(cumulative) / 1_000_000, package.strip()))
+
+        if package.strip() in modules or package.strip().startswith("tempoplay"):
+            seconds += int(cumulative) / 1_000_000
+
+    loaded = set(json.loads(proc.stdout.splitlines()[-1]))
+    return seconds, sorted(top_level, reverse=True)[:5], loaded
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--budget", type=float, help="override every check's budget, in seconds")
+    args = parser.parse_args(argv)
+
+    failures: list[str] = []
+
+    for name, (modules, budget, lazy_dependencies) in CHECKS.items():
+        budget = args.budget if args.budget is not None else budget
+        seconds, slowest, loaded = measure(modules)
+        status = "ok" if seconds <= budget else "OVER BUDGET"
+        print(f"{name:<8} {seconds * 1000:8.1f}ms  (budget {budget * 1000:.0f}ms)  {status}")
+
+        for import_seconds, package in slowest:
+            print(f"           {import_seconds * 1000:8.1f}ms  {package}")
+
+        if seconds > budget:
+            failures.append(f"importing {', '.join(modules)} took {seconds:.3f}s, over the {budget:.3f}s budget")
+
+        if eager := sorted(dependency for dependency in lazy_dependencies if dependency in loaded):
+            failures.append(f"importing {', '.join(modules)} eagerly loaded {', '.join(eager)}")
+
+    for failure in failures:
+        print(f"FAILED {failure}", file=sys.stderr)
+
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,349 @@
+"""
+Offline benchmarks for the hot paths in tempoweave.
+
+    python benchmarks/run.py                      # run everything, compare to baseline.json
+    python benchmarks/run.py -k optimizer         # only run benchmarks matching a substring
+    python benchmarks/run.py --save-baseline      # record the current numbers as the baseline
+
+Nothing here touches the network: Spotify responses are served from recorded JSON
+fixtures, audio is synthesized click tracks, and song libraries are generated.
+"""
+from collections.abc import Callable, Iterator
+from typing import Any
+
+import argparse
+import copy
+import dataclasses
+import json
+import pathlib
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+import wave
+
+from spotipy.oauth2 import SpotifyClientCredentials
+import numpy as np
+
+from tempoplay.fetch import KnownTempoProvider, SongFetcher, estimate_tempo
+from tempoplay.index import TempoIndex
+from tempoplay.library import SongLibrary
+from tempoplay.optimizer import PlaylistOptimizer
+from tempoplay.schema import Song, TempoPlaylistSettings
+from tempoplay.tempo import TempoEngine
+
+HERE = pathlib.Path(__file__).parent
+FIXTURES = HERE / "fixtures"
+BASELINE = HERE / "baseline.json"
+BASE62 = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz"
+
+type BenchmarkFactoryT = Callable[[], Callable[[], Any]]
+
+BENCHMARKS: dict[str, tuple[BenchmarkFactoryT, int]] = {}
+
+
+def benchmark(name: str, repeat: int = 5) -> Callable[[BenchmarkFactoryT], BenchmarkFactoryT]:
+    """Register a benchmark. The decorated function does the setup and returns the code to time."""
+    def decorator(factory: BenchmarkFactoryT) -> BenchmarkFactoryT:
+        BENCHMARKS[name] = (factory, repeat)
+        return factory
+    return decorator
+
+
+@dataclasses.dataclass
+class BenchmarkResult:
+    """Represents the measurements of a single benchmark."""
+
+    name: str
+    latencies: list[float]
+    peak_bytes: int
+
+    def percentile(self, q: float) -> float:
+        return float(np.percentile(self.latencies, q))
+
+    @property
+    def throughput(self) -> float:
+        """Runs per second."""
+        return len(self.latencies) / sum(self.latencies)
+
+    def as_dict(self) -> dict[str, float]:
+        return {
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+            "p99": self.percentile(99),
+            "throughput": self.throughput,
+            "peak_bytes": self.peak_bytes,
+        }
+
+
+def measure(name: str, factory: BenchmarkFactoryT, repeat: int) -> BenchmarkResult:
+    run = factory()
+
+    # Warm up, so import and first-call costs don't skew the numbers.
+    run()
+
+    latencies: list[float] = []
+
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        latencies.append(time.perf_counter() - start)
+
+    # Memory is measured on a separate run, tracemalloc slows everything it traces.
+    tracemalloc.start()
+    run()
+    _, peak_bytes = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return BenchmarkResult(name=name, latencies=latencies, peak_bytes=peak_bytes)
+
+
+# --- FIXTURES ---
+
+def make_track_id(n: int) -> str:
+    """Build a deterministic 22-character base-62 ID."""
+    digits = []
+
+    for _ in range(22):
+        n, remainder = divmod(n, 62)
+        digits.append(BASE62[remainder])
+
+    return "".join(reversed(digits))
+
+
+def make_song_library(size: int, seed: int = 0) -> list[Song]:
+    rng = random.Random(seed)
+    return [
+        Song(
+            track_id=make_track_id(idx),
+            title=f"Song {idx}",
+            artist=f"Artist {rng.randrange(size // 10 + 1)}",
+            album=f"Album {rng.randrange(size // 5 + 1)}",
+            tempo=rng.randrange(60, 200),
+            duration=rng.uniform(2.0, 6.0),
+        )
+        for idx in range(size)
+    ]
+
+
+def write_click_track(path: pathlib.Path, bpm: float, seconds: float = 30.0, sample_rate: int = 22_050) -> np.ndarray:
+    """Synthesize a click track at a known tempo, writing it as a 16-bit WAV."""
+    y = np.zeros(int(seconds * sample_rate), dtype=np.float32)
+    click = np.sin(2 * np.pi * 1000 * np.arange(int(0.01 * sample_rate)) / sample_rate) * np.hanning(int(0.01 * sample_rate))
+
+    for start in np.arange(0, seconds, 60 / bpm):
+        idx = int(start * sample_rate)
+        y[idx: idx + len(click)] += click[: len(y) - idx]
+
+    with wave.open(path.as_posix(), "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(sample_rate)
+        f.writeframes((np.clip(y, -1, 1) * 32767).astype("<i2").tobytes())
+
+    return y
+
+
+class FixtureSpotify:
+    """Serves recorded Spotify responses, cloned to any number of tracks."""
+
+    def __init__(self, n_tracks: int):
+        template = json.loads((FIXTURES / "spotify" / "track.json").read_text())
+        self.page_template = json.loads((FIXTURES / "spotify" / "playlist_items.json").read_text())
+        self.catalog: dict[str, dict[str, Any]] = {}
+
+        for idx in range(n_tracks):
+            track = copy.deepcopy(template)
+            track["id"] = make_track_id(idx)
+            track["name"] = f"{template['name']} ({idx})"
+            track["uri"] = f"spotify:track:{track['id']}"
+            self.catalog[track["id"]] = track
+
+    def tracks(self, track_ids: list[str]) -> dict[str, Any]:
+        return {"tracks": [self.catalog.get(track_id) for track_id in track_ids]}
+
+    def _page(self, offset: int) -> dict[str, Any]:
+        page = copy.deepcopy(self.page_template)
+        track_ids = list(self.catalog)[offset: offset + page["limit"]]
+        page["items"] = [{"is_local": False, "track": self.catalog[track_id]} for track_id in track_ids]
+        page["offset"], page["total"] = offset, len(self.catalog)
+        page["next"] = offset + page["limit"] if offset + page["limit"] < len(self.catalog) else None
+        return page
+
+    def playlist_items(self, playlist_id: str, **kwargs: Any) -> dict[str, Any]:
+        return self._page(0)
+
+    def next(self, page: dict[str, Any]) -> dict[str, Any] | None:
+        return None if page["next"] is None else self._page(page["next"])
+
+
+def make_song_fetcher(n_tracks: int) -> SongFetcher:
+    spotify = FixtureSpotify(n_tracks)
+    known = KnownTempoProvider({"track_id": track_id, "bpm": 120 + idx % 60} for idx, track_id in enumerate(spotify.catalog))
+    fetcher = SongFetcher(SpotifyClientCredentials(client_id="offline", client_secret="offline"), tempo_providers=[known])
+    fetcher.spotify = spotify  # type: ignore[assignment]
+    return fetcher
+
+
+# --- BENCHMARKS ---
+
+@benchmark("fetch.get_song", repeat=200)
+def bench_get_song() -> Callable[[], Any]:
+    fetcher = make_song_fetcher(1)
+    track_id = make_track_id(0)
+
+    def run() -> None:
+        fetcher.song_cache.clear()
+        fetcher.get_song(track_id)
+
+    return run
+
+
+@benchmark("fetch.get_songs_from_playlist[500]", repeat=5)
+def bench_get_songs_from_playlist() -> Callable[[], Any]:
+    fetcher = make_song_fetcher(500)
+
+    def run() -> None:
+        fetcher.song_cache.clear()
+        fetcher.get_songs_from_playlist("0baOrekhXPa0YpUKgrDhs9")
+
+    return run
+
+
+@benchmark("tempo.estimate_tempo[30s click]", repeat=3)
+def bench_estimate_tempo() -> Callable[[], Any]:
+    path = pathlib.Path(tempfile.mkdtemp()) / "click.wav"
+    write_click_track(path, bpm=128)
+    return lambda: estimate_tempo(path)
+
+
+@benchmark("tempo.estimate_tempo_excerpt[30s click]", repeat=3)
+def bench_estimate_tempo_excerpt() -> Callable[[], Any]:
+    if shutil.which("ffmpeg") is None:
+        raise LookupError("ffmpeg is not on PATH")
+
+    path = pathlib.Path(tempfile.mkdtemp()) / "click.wav"
+    write_click_track(path, bpm=128)
+    return lambda: estimate_tempo(path, offset=5.0, duration=20.0, sample_rate=11_025)
+
+
+@benchmark("tempo.engine_batch[16 x 30s click]", repeat=3)
+def bench_tempo_engine() -> Callable[[], Any]:
+    directory = pathlib.Path(tempfile.mkdtemp())
+    waveforms = [write_click_track(directory / f"{bpm}.wav", bpm=bpm) for bpm in range(90, 170, 5)]
+    engine = TempoEngine()
+    return lambda: engine.estimate(waveforms)
+
+
+@benchmark("schema.song_validate[100k]", repeat=3)
+def bench_song_validate() -> Callable[[], Any]:
+    rows = Song.to_rows(make_song_library(100_000))
+    return lambda: [Song(**row) for row in rows]
+
+
+@benchmark("schema.song_from_trusted_rows[100k]", repeat=3)
+def bench_song_from_trusted_rows() -> Callable[[], Any]:
+    rows = Song.to_rows(make_song_library(100_000))
+    return lambda: Song.from_trusted_rows(rows)
+
+
+@benchmark("schema.song_model_dump[100k]", repeat=3)
+def bench_song_model_dump() -> Callable[[], Any]:
+    songs = make_song_library(100_000)
+    return lambda: [song.model_dump() for song in songs]
+
+
+@benchmark("schema.song_to_rows[100k]", repeat=3)
+def bench_song_to_rows() -> Callable[[], Any]:
+    songs = make_song_library(100_000)
+    return lambda: Song.to_rows(songs)
+
+
+def _optimizer_benchmark(size: int, layout: str) -> Callable[[], Any]:
+    songs = make_song_library(size)
+    library: Any = {"list": songs, "columnar": SongLibrary.from_songs(songs), "indexed": TempoIndex(songs)}[layout]
+    optimizer = PlaylistOptimizer(TempoPlaylistSettings.model_validate("60m;100bpm;160bpm;ease_in_out"))
+    return lambda: optimizer.generate_playlist(library, max_iterations=10_000, seed=0)
+
+
+for _size in (1_000, 10_000, 100_000):
+    benchmark(f"optimizer.generate_playlist[{_size // 1000}k]", repeat=3)(lambda size=_size: _optimizer_benchmark(size, "list"))
+    benchmark(f"optimizer.generate_playlist_columnar[{_size // 1000}k]", repeat=3)(lambda size=_size: _optimizer_benchmark(size, "columnar"))
+    benchmark(f"optimizer.generate_playlist_indexed[{_size // 1000}k]", repeat=3)(lambda size=_size: _optimizer_benchmark(size, "indexed"))
+
+
+@benchmark("optimizer.generate_playlist_parallel[100k]", repeat=3)
+def bench_generate_playlist_parallel() -> Callable[[], Any]:
+    library = SongLibrary.from_songs(make_song_library(100_000))
+    optimizer = PlaylistOptimizer(TempoPlaylistSettings.model_validate("60m;100bpm;160bpm;ease_in_out"))
+    return lambda: optimizer.generate_playlist_parallel(library, seed=0)
+
+
+# --- REPORTING ---
+
+def compare(result: BenchmarkResult, baseline: dict[str, float] | None, tolerance: float) -> str | None:
+    """Describe how a result regressed against its baseline, if it did."""
+    if baseline is None:
+        return None
+
+    current = result.as_dict()
+
+    if current["p50"] > baseline["p50"] * (1 + tolerance):
+        return f"p50 {current['p50'] * 1000:.1f}ms vs baseline {baseline['p50'] * 1000:.1f}ms"
+
+    if current["peak_bytes"] > baseline["peak_bytes"] * (1 + tolerance):
+        return f"peak memory {current['peak_bytes'] / 2 ** 20:.1f}MiB vs baseline {baseline['peak_bytes'] / 2 ** 20:.1f}MiB"
+
+    return None
+
+
+def run_benchmarks(pattern: str | None) -> Iterator[BenchmarkResult]:
+    for name, (factory, repeat) in BENCHMARKS.items():
+        if pattern is not None and pattern not in name:
+            continue
+
+        try:
+            yield measure(name, factory, repeat)
+        except LookupError as e:
+            print(f"{name:<48} skipped: {e}")
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-k", dest="pattern", help="only run benchmarks whose name contains this")
+    parser.add_argument("--baseline", type=pathlib.Path, default=BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="record these results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown before failing (0.25 = 25%%)")
+    args = parser.parse_args(argv)
+
+    baseline = json.loads(args.baseline.read_text()) if args.baseline.exists() else {}
+    results: dict[str, dict[str, float]] = {}
+    regressions: list[str] = []
+
+    print(f"{'benchmark':<48} {'p50':>10} {'p95':>10} {'p99':>10} {'ops/s':>10} {'peak':>10}")
+
+    for result in run_benchmarks(args.pattern):
+        stats = results[result.name] = result.as_dict()
+        print(
+            f"{result.name:<48} {stats['p50'] * 1000:>8.2f}ms {stats['p95'] * 1000:>8.2f}ms {stats['p99'] * 1000:>8.2f}ms"
+            f" {stats['throughput']:>10.1f} {stats['peak_bytes'] / 2 ** 20:>7.1f}MiB"
+        )
+
+        if (regression := compare(result, baseline.get(result.name), args.tolerance)) is not None:
+            regressions.append(f"{result.name}: {regression}")
+
+    if args.save_baseline:
+        args.baseline.write_text(json.dumps({**baseline, **results}, indent=2, sort_keys=True) + "\n")
+        print(f"Saved baseline to {args.baseline}")
+        return 0
+
+    for regression in regressions:
+        print(f"REGRESSION {regression}", file=sys.stderr)
+
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,338 @@
+from collections.abc import AsyncIterator, Iterable, Iterator
+from typing import Any, Self
+
+from concurrent import futures
+import asyncio
+import functools as ft
+import itertools as it
+import logging
+
+from spotipy.oauth2 import SpotifyClientCredentials
+import httpx
+
+from tempoplay.cache import TempoCache
+from tempoplay.const import SPOTIFY_MAX_TRACKS_PER_REQUEST, SPOTIFY_RETRYABLE_STATUSES
+from tempoplay.fetch import SongFetcher, analyze_audio
+from tempoplay.schema import Song
+from tempoplay.types import SpotifyIDT, SpotifyURIT, SpotifyURLT
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncSongFetcher:
+    """
+    Fetches information about Songs, without blocking the event loop.
+
+    Spotify is called through an async HTTP client. YT downloads run in threads and
+    tempo estimation runs on .executor (pass a ProcessPoolExecutor to keep librosa off
+    the GIL). Concurrent requests for the same track share a single in-flight task.
+
+    Track metadata is requested in batches, each batch running as a task of its own, so
+    a caller which is cancelled or times out never strands the other callers waiting on
+    the same tracks.
+    """
+
+    def __init__(
+        self,
+        spotify_auth: SpotifyClientCredentials,
+        tempo_cache: TempoCache | None = None,
+        executor: futures.Executor | None = None,
+        max_concurrency: int = 16,
+        max_in_flight: int = 64,
+        max_retries: int = 5,
+        api_prefix: str = "https://api.spotify.com/v1/",
+        http_client: httpx.AsyncClient | None = None,
+        **fetcher_options: Any,
+    ):
+        # The blocking fetcher knows how to authenticate, download and analyze.
+        self.song_fetcher = SongFetcher(spotify_auth, tempo_cache=tempo_cache, **fetcher_options)
+        self.tempo_cache = self.song_fetcher.tempo_cache
+        self.executor = executor
+        self.max_in_flight = max_in_flight
+        self.max_retries = max_retries
+        self.http = http_client or httpx.AsyncClient(base_url=api_prefix, timeout=10.0)
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._tracks_in_flight: dict[SpotifyIDT, asyncio.Future] = {}
+        self._songs_in_flight: dict[SpotifyIDT, asyncio.Task] = {}
+        self._batches: set[asyncio.Task] = set()
+
+    async def __aenter__(self) -> Self:
+        return self
+
+    async def __aexit__(self, *exc_info: Any) -> None:
+        await self.aclose()
+
+    async def aclose(self) -> None:
+        # Nothing may outlive the HTTP client it would use.
+        tasks = [*self._songs_in_flight.values(), *self._batches]
+
+        for task in tasks:
+            task.cancel()
+
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await asyncio.to_thread(self.song_fetcher.flush_snapshot)
+        await self.http.aclose()
+
+    get_spotify_id = staticmethod(SongFetcher.get_spotify_id)
+
+    async def _get(self, url: str, params: dict[str, Any] | None = None) -> dict[str, Any]:
+        """GET a Spotify API resource, retrying on rate limits and server errors."""
+        auth_manager = self.song_fetcher.spotify.auth_manager
+
+        for attempt in range(self.max_retries + 1):
+            # spotipy refreshes the token when needed, which may block on the network.
+            token = await asyncio.to_thread(auth_manager.get_access_token, as_dict=False)
+
+            async with self._semaphore:
+                r = await self.http.get(url, params=params, headers={"Authorization": f"Bearer {token}"})
+
+            if r.status_code not in SPOTIFY_RETRYABLE_STATUSES or attempt == self.max_retries:
+                r.raise_for_status()
+                return r.json()
+
+            try:
+                delay = float(r.headers["Retry-After"])
+            except (KeyError, ValueError):
+                delay = 0.5 * 2 ** attempt
+
+            logger.warning(f"Spotify answered {r.status_code} to GET {url}, retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+        raise AssertionError("unreachable")
+
+    async def _fetch_tracks(self, batch: list[SpotifyIDT]) -> None:
+        """Request a batch of tracks, settling every future the batch owns whatever happens."""
+        owned = {track_id: self._tracks_in_flight[track_id] for track_id in batch}
+
+        try:
+            r = await self._get("tracks", params={"ids": ",".join(batch)})
+
+            # Spotify answers in request order, with null for any unknown track.
+            for track_id, track in zip(batch, r["tracks"], strict=True):
+                owned[track_id].set_result(track)
+
+        except Exception as e:
+            for future in owned.values():
+                if not future.done():
+                    future.set_exception(e)
+
+        finally:
+            # Even when cancelled, so later requests for these tracks start afresh.
+            for track_id, future in owned.items():
+                if self._tracks_in_flight.get(track_id) is future:
+                    del self._tracks_in_flight[track_id]
+
+                if not future.done():
+                    future.cancel()
+
+    async def get_tracks(self, song_identities: Iterable[SpotifyURIT | SpotifyURLT | SpotifyIDT]) -> dict[SpotifyIDT, dict[str, Any] | None]:
+        """Fetch Spotify metadata for many tracks, keyed by track ID. Missing tracks map to None."""
+        track_ids = list(dict.fromkeys(self.get_spotify_id(song_identity) for song_identity in song_identities))
+        pending: dict[SpotifyIDT, asyncio.Future] = {}
+        owned: list[SpotifyIDT] = []
+        loop = asyncio.get_running_loop()
+
+        for track_id in track_ids:
+            if track_id not in self._tracks_in_flight:
+                self._tracks_in_flight[track_id] = loop.create_future()
+                owned.append(track_id)
+
+            pending[track_id] = self._tracks_in_flight[track_id]
+
+        for batch in it.batched(owned, SPOTIFY_MAX_TRACKS_PER_REQUEST):
+            task = asyncio.create_task(self._fetch_tracks(list(batch)))
+            self._batches.add(task)
+            task.add_done_callback(self._batches.discard)
+
+        # Shield the shared futures, so one caller being cancelled doesn't cancel them for the rest.
+        return {track_id: await asyncio.shield(pending[track_id]) for track_id in track_ids}
+
+    async def is_song_on_spotify(self, song: Song) -> bool:
+        """Determine if a song still exists on Spotify."""
+        try:
+            track = (await self.get_tracks([song.track_id]))[song.track_id]
+        except httpx.HTTPStatusError as e:
+            if e.response.status_code in (400, 404):
+                return False
+            raise
+        else:
+            return track is not None
+
+    async def _estimate_tempo(self, track: dict[str, Any]) -> float:
+        """Estimate a track's tempo off the event loop, downloading it only once every local tempo provider has missed."""
+        if (tempo := await asyncio.to_thread(self.song_fetcher.lookup_tempo, track, self.song_fetcher.local_tempo_providers)) is not None:
+            return tempo
+
+        audio_path, source = await asyncio.to_thread(self.song_fetcher.download_audio_from_yt, track, True)
+
+        loop = asyncio.get_running_loop()
+        analyze = ft.partial(analyze_audio, audio_path, **self.song_fetcher.analysis_options(track))
+
+        try:
+            analysis = await loop.run_in_executor(self.executor, analyze)
+        finally:
+            await asyncio.to_thread(self.song_fetcher.release_audio, audio_path)
+
+        analysis.record()
+        await asyncio.to_thread(self.song_fetcher.save_analysis, track, analysis)
+
+        if self.tempo_cache is not None:
+            await asyncio.to_thread(self.tempo_cache.set, track["id"], analysis.tempo, source=source)
+
+        return analysis.tempo
+
+    async def _get_song(self, track_id: SpotifyIDT, track: dict[str, Any] | None = None) -> Song:
+        try:
+            song = self.song_fetcher.song_cache[track_id]
+        except KeyError:
+            pass
+        else:
+            if song is None:
+                raise RuntimeError(f"Could not find a Song for '{track_id}'")
+            return song
+
+        if track is None:
+            track = (await self.get_tracks([track_id]))[track_id]
+
+        if track is None:
+            self.song_fetcher.song_cache.set_missing(track_id)
+            raise RuntimeError(f"Could not find a Song for '{track_id}'")
+
+        song = self.song_fetcher.build_song(track, tempo=await self._estimate_tempo(track))
+
+        # Cache it like the blocking fetcher would. Saving to the snapshot may write to disk.
+        await asyncio.to_thread(self.song_fetcher.remember, song)
+        return song
+
+    def _song_task(self, track_id: SpotifyIDT, track: dict[str, Any] | None = None) -> asyncio.Task:
+        """Find or start the shared task fetching a song, reusing its metadata if it's already known."""
+        if (task := self._songs_in_flight.get(track_id)) is None:
+            task = self._songs_in_flight[track_id] = asyncio.create_task(self._get_song(track_id, track), name=track_id)
+            task.add_done_callback(lambda _: self._songs_in_flight.pop(track_id, None))
+
+        return task
+
+    async def get_song(self, song_identity: SpotifyURIT | SpotifyURLT | SpotifyIDT) -> Song:
+        """Fetch a song."""
+        # Shield the shared task, so one caller being cancelled doesn't cancel it for the rest.
+        song = await asyncio.shield(self._song_task(self.get_spotify_id(song_identity)))
+        await asyncio.to_thread(self.song_fetcher.flush_snapshot)
+        return song
+
+    @staticmethod
+    def _completed(done: Iterable[asyncio.Task]) -> Iterator[Song]:
+        """Walk the songs of finished tasks, logging (and skipping) any which failed."""
+        for task in done:
+            if task.cancelled():
+                continue
+
+            if (e := task.exception()) is not None:
+                logger.warning(f"Failed to fetch song '{task.get_name()}': {e}")
+                continue
+
+            yield task.result()
+
+    async def _stream_songs(self, track_batches: AsyncIterator[list[dict[str, Any]]], max_in_flight: int | None = None) -> AsyncIterator[Song]:
+        """Start on each batch of tracks as soon as it arrives, yielding songs as they complete."""
+        max_in_flight = max_in_flight or self.max_in_flight
+        in_flight: set[asyncio.Task] = set()
+
+        async for tracks in track_batches:
+            for track in tracks:
+                # Make room before starting another song, yielding whatever finished meanwhile.
+                while len(in_flight) >= max_in_flight:
+                    done, in_flight = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+
+                    for song in self._completed(done):
+                        yield song
+
+                in_flight.add(self._song_task(track["id"], track))
+
+        while in_flight:
+            done, in_flight = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+
+            for song in self._completed(done):
+                yield song
+
+        # Songs left over by a stream which stopped early are written by .aclose().
+        await asyncio.to_thread(self.song_fetcher.flush_snapshot)
+
+    async def _track_batches(self, song_identities: Iterable[SpotifyURIT | SpotifyURLT | SpotifyIDT]) -> AsyncIterator[list[dict[str, Any]]]:
+        """Walk the metadata of many tracks, one multi-track request at a time."""
+        track_ids = dict.fromkeys(self.get_spotify_id(song_identity) for song_identity in song_identities)
+
+        for batch in it.batched(track_ids, SPOTIFY_MAX_TRACKS_PER_REQUEST):
+            tracks = await self.get_tracks(batch)
+
+            if missing := [track_id for track_id, track in tracks.items() if track is None]:
+                logger.warning(f"Could not find a Song for {missing}")
+
+            yield [track for track in tracks.values() if track is not None]
+
+    async def iter_songs(
+        self,
+        song_identities: Iterable[SpotifyURIT | SpotifyURLT | SpotifyIDT],
+        max_in_flight: int | None = None,
+    ) -> AsyncIterator[Song]:
+        """Stream many songs as each one completes, requesting their metadata in batches."""
+        async for song in self._stream_songs(self._track_batches(song_identities), max_in_flight):
+            yield song
+
+    async def iter_playlist_tracks(self, playlist_identity: SpotifyURIT | SpotifyURLT | SpotifyIDT) -> AsyncIterator[list[dict[str, Any]]]:
+        """Walk a playlist a page of tracks at a time, prefetching the next page while this one is consumed."""
+        playlist_id = self.get_spotify_id(playlist_identity)
+        page = await self._get(f"playlists/{playlist_id}/tracks", params={"additional_types": "track"})
+        next_page: asyncio.Task | None = None
+
+        try:
+            while page is not None:
+                next_page = asyncio.create_task(self._get(page["next"])) if page.get("next") else None
+
+                # Local files and tracks removed from Spotify have no usable track ID.
+                yield [
+                    track
+                    for playlist_item in page["items"]
+                    if (track := playlist_item.get("track")) is not None and track.get("id") is not None
+                ]
+
+                page = None if next_page is None else await next_page
+
+        finally:
+            if next_page is not None and not next_page.done():
+                next_page.cancel()
+
+    async def iter_playlist_track_ids(self, playlist_identity: SpotifyURIT | SpotifyURLT | SpotifyIDT) -> AsyncIterator[SpotifyIDT]:
+        """Walk every track ID in a playlist."""
+        async for tracks in self.iter_playlist_tracks(playlist_identity):
+            for track in tracks:
+                yield track["id"]
+
+    async def iter_songs_from_playlist(
+        self,
+        playlist_identity: SpotifyURIT | SpotifyURLT | SpotifyIDT,
+        max_in_flight: int | None = None,
+    ) -> AsyncIterator[Song]:
+        """
+        Stream all songs from a playlist as each one completes.
+
+        Each page's songs are started as soon as the page arrives, from the track metadata
+        already on it, and no more than .max_in_flight songs are fetched at once.
+        """
+        async for song in self._stream_songs(self.iter_playlist_tracks(playlist_identity), max_in_flight):
+            yield song
+
+    async def get_songs_from_playlist(
+        self,
+        playlist_identity: SpotifyURIT | SpotifyURLT | SpotifyIDT,
+        max_in_flight: int | None = None,
+    ) -> list[Song]:
+        """Fetch all songs from a playlist, in playlist order."""
+        track_ids: list[SpotifyIDT] = []
+
+        async def pages() -> AsyncIterator[list[dict[str, Any]]]:
+            async for tracks in self.iter_playlist_tracks(playlist_identity):
+                track_ids.extend(track["id"] for track in tracks)
+                yield tracks
+
+        songs = {song.track_id: song async for song in self._stream_songs(pages(), max_in_flight)}
+        return [songs[track_id] for track_id in track_ids if track_id in songs]
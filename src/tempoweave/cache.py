@@ -0,0 +1,389 @@
+from collections.abc import Callable, Iterable
+from typing import Any
+
+from collections import OrderedDict
+import dataclasses
+import datetime as dt
+import hashlib
+import json
+import logging
+import os
+import pathlib
+import shutil
+import threading
+import time
+import uuid
+
+import numpy as np
+import sqlalchemy as sa
+
+from tempoplay.const import TEMPO_ESTIMATOR_VERSION
+from tempoplay.schema import Song
+from tempoplay.types import SpotifyIDT
+
+logger = logging.getLogger(__name__)
+
+
+class TempoCache:
+    """Persist tempo estimates across processes, keyed by Spotify track ID."""
+
+    def __init__(self, db_engine: sa.engine.Engine, estimator_version: str = TEMPO_ESTIMATOR_VERSION):
+        self.db_engine = db_engine
+        self.estimator_version = estimator_version
+        self.metadata = sa.MetaData()
+        self.table = sa.Table(
+            "tempo_estimates",
+            self.metadata,
+            sa.Column("track_id", sa.String, primary_key=True),
+            sa.Column("tempo", sa.Float, nullable=False),
+            sa.Column("estimator_version", sa.String, nullable=False),
+            sa.Column("source", sa.String, nullable=True),
+            sa.Column("analyzed_at", sa.DateTime, nullable=False),
+        )
+        self.metadata.create_all(self.db_engine)
+
+    def for_estimator(self, estimator_version: str) -> "TempoCache":
+        """Share this cache's table, reading and writing the estimates of another estimator."""
+        if estimator_version == self.estimator_version:
+            return self
+
+        return TempoCache(self.db_engine, estimator_version)
+
+    def get(self, track_id: SpotifyIDT) -> float | None:
+        """Fetch the stored tempo, if it was produced by the current estimator."""
+        q = sa.select(self.table.c.tempo, self.table.c.estimator_version).where(self.table.c.track_id == track_id)
+
+        with self.db_engine.connect() as conn:
+            row = conn.execute(q).first()
+
+        if row is None:
+            return None
+
+        if row.estimator_version != self.estimator_version:
+            logger.debug(f"Stale tempo for '{track_id}' (estimated by {row.estimator_version})")
+            return None
+
+        return row.tempo
+
+    def get_many(self, track_ids: list[SpotifyIDT]) -> dict[SpotifyIDT, float]:
+        """Fetch the stored tempo for all known tracks."""
+        q = (
+            sa.select(self.table.c.track_id, self.table.c.tempo)
+            .where(self.table.c.track_id.in_(track_ids))
+            .where(self.table.c.estimator_version == self.estimator_version)
+        )
+
+        with self.db_engine.connect() as conn:
+            return {row.track_id: row.tempo for row in conn.execute(q)}
+
+    def set(self, track_id: SpotifyIDT, tempo: float, *, source: str | None = None) -> None:
+        """Store (or replace) the tempo estimate for a track."""
+        row: dict[str, Any] = {
+            "track_id": track_id,
+            "tempo": tempo,
+            "estimator_version": self.estimator_version,
+            "source": source,
+            "analyzed_at": dt.datetime.now(tz=dt.UTC),
+        }
+
+        update = sa.update(self.table).where(self.table.c.track_id == track_id).values(**row)
+
+        with self.db_engine.begin() as conn:
+            if conn.execute(update).rowcount == 1:
+                return
+
+            try:
+                with conn.begin_nested():
+                    conn.execute(sa.insert(self.table).values(**row))
+            except sa.exc.IntegrityError:
+                # Another worker stored this track at the same time.
+                conn.execute(update)
+
+    def __contains__(self, track_id: SpotifyIDT) -> bool:
+        return self.get(track_id) is not None
+
+
+@dataclasses.dataclass
+class CacheStats:
+    """Counters describing how a cache is performing."""
+
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    expirations: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+
+class SongCache:
+    """
+    A bounded, thread-safe cache of Songs keyed by Spotify track ID.
+
+    Entries expire after .ttl seconds and the least recently used entry is evicted
+    once .max_size is reached. Tracks which Spotify reports as missing are cached as
+    None for .negative_ttl seconds, so they aren't requested over and over.
+    """
+
+    def __init__(
+        self,
+        max_size: int = 10_000,
+        ttl: float | None = 24 * 60 * 60,
+        negative_ttl: float | None = 60 * 60,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.stats = CacheStats()
+        self._clock = clock
+        self._entries: OrderedDict[SpotifyIDT, tuple[Song | None, float | None]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __getitem__(self, track_id: SpotifyIDT) -> Song | None:
+        """Fetch a cached Song, or None if the track is known to be missing. Raises KeyError on a miss."""
+        with self._lock:
+            try:
+                song, expires_at = self._entries[track_id]
+            except KeyError:
+                self.stats.misses += 1
+                raise
+
+            if expires_at is not None and expires_at <= self._clock():
+                del self._entries[track_id]
+                self.stats.expirations += 1
+                self.stats.misses += 1
+                raise KeyError(track_id)
+
+            self._entries.move_to_end(track_id)
+            self.stats.hits += 1
+            return song
+
+    def _put(self, track_id: SpotifyIDT, song: Song | None, ttl: float | None) -> None:
+        expires_at = None if ttl is None else self._clock() + ttl
+
+        with self._lock:
+            self._entries[track_id] = (song, expires_at)
+            self._entries.move_to_end(track_id)
+
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.stats.evictions += 1
+
+    def set(self, track_id: SpotifyIDT, song: Song) -> None:
+        """Cache a Song."""
+        self._put(track_id, song, self.ttl)
+
+    def set_missing(self, track_id: SpotifyIDT) -> None:
+        """Remember that a track does not exist on Spotify."""
+        self._put(track_id, None, self.negative_ttl)
+
+    def discard(self, track_id: SpotifyIDT) -> None:
+        """Forget a track."""
+        with self._lock:
+            self._entries.pop(track_id, None)
+
+    def clear(self) -> None:
+        """Forget every track."""
+        with self._lock:
+            self._entries.clear()
+
+
+class AudioCache:
+    """
+    A size-bounded, content-addressed store for downloaded audio and extracted features.
+
+    Layout under .root:
+
+        objects/<sha256[:2]>/<sha256><suffix>   audio, stored once however many tracks share it
+        refs/<track_id>.json                    which object a track resolved to, and its source
+        features/<track_id>/<name>.npy          extracted features, such as the onset envelope
+
+    Every write lands in tmp/ first and is renamed into place, so concurrent workers never
+    see a partial file. Reads refresh a file's mtime, and once the store grows beyond
+    .max_bytes the least recently used audio and feature files are evicted. Set
+    .keep_audio=False to keep only features once they have been extracted.
+    """
+
+    def __init__(self, root: pathlib.Path | str, max_bytes: int = 2 * 1024 ** 3, keep_audio: bool = True):
+        self.root = pathlib.Path(root)
+        self.max_bytes = max_bytes
+        self.keep_audio = keep_audio
+        self._lock = threading.Lock()
+
+        for directory in ("objects", "refs", "features", "tmp"):
+            (self.root / directory).mkdir(parents=True, exist_ok=True)
+
+    def _temp_path(self) -> pathlib.Path:
+        return self.root / "tmp" / uuid.uuid4().hex
+
+    def _write_atomic(self, path: pathlib.Path, data: bytes) -> None:
+        temp = self._temp_path()
+        temp.write_bytes(data)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(temp, path)
+
+    def _ref_path(self, track_id: SpotifyIDT) -> pathlib.Path:
+        return self.root / "refs" / f"{track_id}.json"
+
+    def _object_path(self, ref: dict[str, Any]) -> pathlib.Path:
+        return self.root / "objects" / ref["sha256"][:2] / f"{ref['sha256']}{ref['suffix']}"
+
+    def _read_ref(self, path: pathlib.Path) -> dict[str, Any] | None:
+        try:
+            return json.loads(path.read_text())
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def _feature_path(self, track_id: SpotifyIDT, name: str) -> pathlib.Path:
+        return self.root / "features" / track_id / f"{name}.npy"
+
+    @staticmethod
+    def _touch(path: pathlib.Path) -> None:
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+
+    def get_audio(self, track_id: SpotifyIDT) -> tuple[pathlib.Path, str | None] | None:
+        """Find the cached audio for a track, along with the source it was downloaded from."""
+        if (ref := self._read_ref(self._ref_path(track_id))) is None:
+            return None
+
+        path = self._object_path(ref)
+
+        if not path.exists():
+            return None
+
+        self._touch(path)
+        return path, ref.get("source")
+
+    def put_audio(self, track_id: SpotifyIDT, audio_path: pathlib.Path, source: str | None = None) -> pathlib.Path:
+        """Move a downloaded file into the cache, returning where it now lives."""
+        digest = hashlib.sha256()
+
+        with audio_path.open("rb") as f:
+            while chunk := f.read(1024 * 1024):
+                digest.update(chunk)
+
+        sha256 = digest.hexdigest()
+        path = self.root / "objects" / sha256[:2] / f"{sha256}{audio_path.suffix}"
+
+        ref = {"sha256": sha256, "suffix": audio_path.suffix, "source": source}
+
+        # Hold the lock until the ref exists, so _drop_audio() never sees the object unreferenced.
+        with self._lock:
+            if path.exists():
+                audio_path.unlink(missing_ok=True)
+                self._touch(path)
+            else:
+                temp = self._temp_path()
+                shutil.move(audio_path, temp)
+                path.parent.mkdir(parents=True, exist_ok=True)
+                os.replace(temp, path)
+
+                # The downloader may have dated the file by the server's Last-Modified header.
+                self._touch(path)
+
+            self._write_atomic(self._ref_path(track_id), json.dumps(ref).encode())
+
+        self.evict(keep=(path,))
+        return path
+
+    def get_features(self, track_id: SpotifyIDT, name: str) -> np.ndarray | None:
+        """Load a feature previously extracted for a track."""
+        path = self._feature_path(track_id, name)
+
+        try:
+            features = np.load(path, allow_pickle=False)
+        except FileNotFoundError:
+            return None
+
+        self._touch(path)
+        return features
+
+    def put_features(self, track_id: SpotifyIDT, name: str, features: np.ndarray) -> None:
+        """Store a feature extracted for a track, dropping its audio unless .keep_audio."""
+        path = self._feature_path(track_id, name)
+        temp = self._temp_path()
+
+        with temp.open("wb") as f:
+            np.save(f, features, allow_pickle=False)
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(temp, path)
+
+        if not self.keep_audio:
+            self._drop_audio(track_id)
+
+        self.evict()
+
+    def _drop_audio(self, track_id: SpotifyIDT) -> None:
+        """Delete the audio a track resolved to, unless another track still refers to the same object."""
+        if (ref := self._read_ref(self._ref_path(track_id))) is None:
+            return
+
+        with self._lock:
+            for path in (self.root / "refs").glob("*.json"):
+                if path.stem == track_id:
+                    continue
+
+                if (other := self._read_ref(path)) is not None and other["sha256"] == ref["sha256"]:
+                    return
+
+            self._object_path(ref).unlink(missing_ok=True)
+
+    def size(self) -> int:
+        """Total bytes of audio and features in the cache."""
+        return sum(path.stat().st_size for path in self._files())
+
+    def _files(self) -> list[pathlib.Path]:
+        return [path for directory in ("objects", "features") for path in (self.root / directory).rglob("*") if path.is_file()]
+
+    def evict(self, keep: Iterable[pathlib.Path] = ()) -> int:
+        """
+        Delete least recently used files until the cache fits in .max_bytes, never deleting
+        those in .keep. Returns the bytes freed.
+        """
+        keep = set(keep)
+
+        with self._lock:
+            files = []
+
+            for path in self._files():
+                try:
+                    stat = path.stat()
+                except FileNotFoundError:
+                    continue
+
+                files.append((stat.st_mtime, stat.st_size, path))
+
+            total = sum(size for _, size, _ in files)
+            freed = 0
+
+            for _, size, path in sorted(files):
+                if total - freed <= self.max_bytes:
+                    break
+
+                if path in keep:
+                    continue
+
+                path.unlink(missing_ok=True)
+                freed += size
+
+            if freed:
+                self._drop_dangling_refs()
+                logger.debug(f"Evicted {freed} bytes from the audio cache at '{self.root}'")
+
+            return freed
+
+    def _drop_dangling_refs(self) -> None:
+        """Forget the tracks whose audio has been deleted."""
+        for path in (self.root / "refs").glob("*.json"):
+            if (ref := self._read_ref(path)) is not None and not self._object_path(ref).exists():
+                path.unlink(missing_ok=True)
@@ -0,0 +1,233 @@
+"""
+Build, sync and analyze tempo playlists from the command line.
+
+Only the standard library is imported up front. Each command imports what it needs
+when it runs, so short-lived jobs never pay for librosa, yt_dlp or spotipy unless they
+use them.
+"""
+from collections.abc import Sequence
+from typing import TYPE_CHECKING, Any
+
+import argparse
+import itertools as it
+import logging
+import os
+import pathlib
+import sys
+
+if TYPE_CHECKING:
+    from tempoplay.fetch import SongFetcher
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DB_URL = "sqlite:///tempoweave.db"
+
+DEFAULT_SPOTIFY_RATE = 10.0
+
+
+def _make_song_fetcher(args: argparse.Namespace, user_auth: bool = False) -> "SongFetcher":
+    """Build a SongFetcher from the environment and the shared command-line options."""
+    import sqlalchemy as sa
+    from spotipy.oauth2 import SpotifyClientCredentials, SpotifyOAuth
+
+    from tempoplay.cache import TempoCache
+    from tempoplay.const import SPOTIFY_OAUTH_REDIRECT_URI, SPOTIFY_OAUTH_SCOPES
+    from tempoplay.fetch import SongFetcher
+    from tempoplay.ratelimit import TokenBucket
+    from tempoplay.secrets import GitHubActionsCacheHandler
+    from tempoplay.snapshot import SongSnapshot
+
+    db_engine = sa.create_engine(args.db, pool_pre_ping=True)
+
+    if user_auth:
+        # Changing a playlist needs a user's token, kept encrypted alongside everything else.
+        spotify_auth = SpotifyOAuth(
+            client_id=os.environ["SPOTIFY_CLIENT_ID"],
+            client_secret=os.environ["SPOTIFY_CLIENT_SECRET"],
+            redirect_uri=SPOTIFY_OAUTH_REDIRECT_URI,
+            scope=list(SPOTIFY_OAUTH_SCOPES),
+            cache_handler=GitHubActionsCacheHandler(secret_key=os.environ["ENCRYPTION_KEY"], db_engine=db_engine),
+        )
+    else:
+        spotify_auth = SpotifyClientCredentials(
+            client_id=os.environ["SPOTIFY_CLIENT_ID"],
+            client_secret=os.environ["SPOTIFY_CLIENT_SECRET"],
+        )
+
+    return SongFetcher(
+        spotify_auth,
+        tempo_cache=TempoCache(db_engine),
+        fast_analysis=args.fast,
+        # One bucket for every thread, so the whole run stays within the budget.
+        rate_limiter=TokenBucket(args.rate) if args.rate > 0 else None,
+        snapshot=None if args.snapshot is None else SongSnapshot(args.snapshot),
+    )
+
+
+def build(args: argparse.Namespace) -> int:
+    """Regenerate tempo playlists from the settings in their descriptions."""
+    from tempoplay.scheduler import BatchScheduler, PlaylistJob
+
+    song_fetcher = _make_song_fetcher(args, user_auth=args.publish)
+    seeds = tuple(song_fetcher.get_spotify_id(seed) for seed in args.seed)
+    jobs = [PlaylistJob(song_fetcher.get_spotify_id(playlist), seed_playlists=seeds) for playlist in args.playlists]
+
+    scheduler = BatchScheduler(song_fetcher, max_iterations=args.max_iterations)
+    reports = scheduler.run(jobs, publish=args.publish)
+
+    for report in reports:
+        if report.error is not None:
+            print(f"{report.playlist_id}  FAILED  {report.error}")
+            continue
+
+        assert report.result is not None
+        print(f"{report.playlist_id}  {len(report.result.songs)} songs  {report.result.total_duration:.1f}m  fitness={report.result.fitness_score:.3f}")
+
+    return 1 if any(report.error is not None for report in reports) else 0
+
+
+def sync(args: argparse.Namespace) -> int:
+    """Bring the local library in step with seed playlists."""
+    import sqlalchemy as sa
+
+    from tempoplay.sync import PlaylistSync
+
+    song_fetcher = _make_song_fetcher(args)
+
+    with PlaylistSync(song_fetcher, sa.create_engine(args.db, pool_pre_ping=True)) as playlist_sync:
+        results = playlist_sync.sync_many(args.playlists)
+
+        for result in results:
+            status = "changed" if result.changed else "unchanged"
+            print(f"{result.playlist_id}  {status}  +{len(result.added)} -{len(result.removed)}  {len(result.pending)} analyzing")
+
+        if args.wait:
+            for result in results:
+                result.wait()
+
+    return 0 if len(results) == len(args.playlists) else 1
+
+
+def analyze(args: argparse.Namespace) -> int:
+    """Estimate the tempo of local audio files."""
+    from tempoplay.fetch import load_audio
+    from tempoplay.metrics import metrics
+    from tempoplay.tempo import TempoEngine
+
+    engine = TempoEngine()
+    options: dict[str, Any] = {"sample_rate": engine.sample_rate}
+    failed = 0
+
+    if args.fast:
+        options.update(offset=args.offset, duration=args.duration)
+
+    # Decode a batch of files, then estimate all of their tempos in one pass.
+    for batch in it.batched(args.files, args.batch_size):
+        audio_paths: list[pathlib.Path] = []
+        waveforms = []
+
+        for audio_path in batch:
+            try:
+                with metrics.timer("decode", decoder="ffmpeg" if args.fast else "librosa"):
+                    waveforms.append(load_audio(audio_path, **options))
+            except Exception as e:
+                logger.error(f"Could not analyze '{audio_path}': {e}")
+                failed += 1
+                continue
+
+            audio_paths.append(audio_path)
+
+        for audio_path, estimate in zip(audio_paths, engine.estimate(waveforms)):
+            print(
+                f"{estimate.bpm:7.2f} BPM  confidence={estimate.confidence:.2f}  "
+                f"half={estimate.half_strength:.2f}  double={estimate.double_strength:.2f}  {audio_path}"
+            )
+
+    return 1 if failed else 0
+
+
+def schedule(args: argparse.Namespace) -> int:
+    """Show the tempo progression a playlist description asks for."""
+    from tempoplay.schedule import calculate_tempo_schedule
+    from tempoplay.schema import TempoPlaylistSettings
+
+    settings = TempoPlaylistSettings.model_validate(args.description)
+    tempo_ranges = calculate_tempo_schedule(
+        duration=settings.duration,
+        min_tempo=settings.min_tempo,
+        max_tempo=settings.max_tempo,
+        easing_function=settings.easing_function,
+    )
+
+    for tempo_range in tempo_ranges:
+        print(f"{tempo_range.min_tempo:>4}-{tempo_range.max_tempo:<4} BPM  {tempo_range.required_duration:5.1f}m")
+
+    return 0
+
+
+def make_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="tempoweave", description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-v", "--verbose", action="count", default=0, help="log more (repeat for debug output)")
+    parser.add_argument("--metrics", type=pathlib.Path, help="record stage timings and write them here (.prom or .jsonl)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    spotify = argparse.ArgumentParser(add_help=False)
+    spotify.add_argument("--db", default=os.environ.get("TEMPOWEAVE_DB", DEFAULT_DB_URL), help="SQLAlchemy URL for caches and tokens")
+    spotify.add_argument("--snapshot", type=pathlib.Path, help="directory of a SongSnapshot to read and extend")
+    spotify.add_argument("--fast", action="store_true", help="analyze an excerpt of each song instead of all of it")
+    spotify.add_argument(
+        "--rate",
+        type=float,
+        default=float(os.environ.get("TEMPOWEAVE_SPOTIFY_RATE", DEFAULT_SPOTIFY_RATE)),
+        help="Spotify requests per second shared by the whole run, 0 for no limit",
+    )
+
+    p = commands.add_parser("build", parents=[spotify], help=build.__doc__)
+    p.add_argument("playlists", nargs="+", help="tempo playlists to regenerate")
+    p.add_argument("--seed", action="append", default=[], help="playlist to draw songs from (repeatable)")
+    p.add_argument("--publish", action="store_true", help="replace the playlists' contents on Spotify")
+    p.add_argument("--max-iterations", type=int, default=2000)
+    p.set_defaults(handler=build)
+
+    p = commands.add_parser("sync", parents=[spotify], help=sync.__doc__)
+    p.add_argument("playlists", nargs="+", help="seed playlists to keep in step with")
+    p.add_argument("--wait", action="store_true", help="wait for background analysis to finish, rather than leave queued tracks to the next sync")
+    p.set_defaults(handler=sync)
+
+    p = commands.add_parser("analyze", help=analyze.__doc__)
+    p.add_argument("files", nargs="+", type=pathlib.Path)
+    p.add_argument("--fast", action="store_true", help="analyze an excerpt instead of the whole file")
+    p.add_argument("--offset", type=float, default=30.0, help="where the excerpt starts, in seconds")
+    p.add_argument("--duration", type=float, default=60.0, help="how long the excerpt is, in seconds")
+    p.add_argument("--batch-size", type=int, default=16, help="files to decode and estimate together")
+    p.set_defaults(handler=analyze)
+
+    p = commands.add_parser("schedule", help=schedule.__doc__)
+    p.add_argument("description", help="e.g. '60m; 100bpm; 160bpm; ease_in_out'")
+    p.set_defaults(handler=schedule)
+
+    return parser
+
+
+def main(argv: Sequence[str] | None = None) -> int:
+    args = make_parser().parse_args(argv)
+    logging.basicConfig(level=logging.WARNING - 10 * min(args.verbose, 2), format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    if args.metrics is not None:
+        from tempoplay.metrics import metrics
+
+        metrics.enable()
+
+    try:
+        return args.handler(args)
+
+    finally:
+        if args.metrics is not None:
+            if args.metrics.suffix == ".jsonl":
+                metrics.write_jsonl(args.metrics)
+            else:
+                metrics.write_prometheus(args.metrics)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,123 @@
+from typing import Any
+
+from concurrent import futures
+import logging
+import random
+import threading
+import time
+
+from requests.adapters import HTTPAdapter
+from spotipy.exceptions import SpotifyException
+import requests
+import spotipy
+
+from tempoplay.const import SPOTIFY_RETRYABLE_STATUSES
+from tempoplay.metrics import metrics
+from tempoplay.ratelimit import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+
+class SpotifyClient(spotipy.Spotify):
+    """
+    A Spotify client tuned for high-concurrency use.
+
+    - every call reuses connections from a shared keep-alive pool
+    - every call draws from a TokenBucket, which may be shared with other clients
+    - a 429 pauses the whole bucket for its Retry-After, so all threads back off together
+    - identical GETs which are already in flight share a single response
+    """
+
+    def __init__(
+        self,
+        *args: Any,
+        rate_limiter: TokenBucket | None = None,
+        pool_size: int = 32,
+        max_retries: int = 5,
+        max_backoff: float = 60.0,
+        api_prefix: str | None = None,
+        **kwargs: Any,
+    ):
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+
+        # Passing our own session disables spotipy's per-request urllib3 retries, we
+        # handle those below so that they respect the shared rate budget.
+        super().__init__(*args, requests_session=session, **kwargs)
+
+        if api_prefix is not None:
+            # Point at another server, such as a local stub. Pair it with an auth_manager which
+            # hands out a token itself, or spotipy still asks accounts.spotify.com for one.
+            self.prefix = api_prefix
+
+        self.rate_limiter = rate_limiter
+        self.max_retries = max_retries
+        self.max_backoff = max_backoff
+        self._in_flight: dict[tuple[str, str], futures.Future] = {}
+        self._in_flight_lock = threading.Lock()
+
+    def _backoff(self, attempt: int, error: SpotifyException) -> float:
+        """Determine how long to wait before retrying a failed call."""
+        headers = error.headers or {}
+
+        try:
+            retry_after = float(headers["Retry-After"])
+        except (KeyError, TypeError, ValueError):
+            retry_after = min(self.max_backoff, 0.5 * 2 ** attempt)
+            retry_after += random.uniform(0, retry_after / 2)
+
+        return min(retry_after, self.max_backoff)
+
+    def _call_with_retries(self, method: str, url: str, payload: Any, params: dict[str, Any]) -> Any:
+        for attempt in range(self.max_retries + 1):
+            if self.rate_limiter is not None:
+                metrics.observe("rate_limit_wait", self.rate_limiter.acquire())
+
+            try:
+                return super()._internal_call(method, url, payload, params)
+
+            except SpotifyException as e:
+                if e.http_status not in SPOTIFY_RETRYABLE_STATUSES or attempt == self.max_retries:
+                    raise
+
+                delay = self._backoff(attempt, e)
+                metrics.increment("spotify_retries", status=e.http_status)
+                logger.warning(f"Spotify answered {e.http_status} to {method} {url}, retrying in {delay:.1f}s")
+
+                if e.http_status == 429 and self.rate_limiter is not None:
+                    self.rate_limiter.pause(delay)
+                else:
+                    time.sleep(delay)
+
+        raise AssertionError("unreachable")
+
+    def _internal_call(self, method: str, url: str, payload: Any, params: dict[str, Any]) -> Any:
+        if method != "GET":
+            return self._call_with_retries(method, url, payload, params)
+
+        key = (url, repr(sorted(params.items())))
+
+        with self._in_flight_lock:
+            if (future := self._in_flight.get(key)) is None:
+                future = self._in_flight[key] = futures.Future()
+                owner = True
+            else:
+                owner = False
+
+        if not owner:
+            metrics.increment("spotify_coalesced")
+            return future.result()
+
+        try:
+            result = self._call_with_retries(method, url, payload, params)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._in_flight_lock:
+                self._in_flight.pop(key, None)
@@ -1 +1,23 @@
 ONE_MINUTE_IN_MILLISECONDS = 1 * 60 * 1000
+
+TEMPO_ESTIMATOR_VERSION = "librosa.beat.beat_track/1"
+
+SNAPSHOT_FORMAT_VERSION = 1
+
+# How many songs SongFetcher.remember() queues before appending them to a SongSnapshot.
+SNAPSHOT_APPEND_BATCH_SIZE = 100
+
+SPOTIFY_MAX_TRACKS_PER_REQUEST = 50
+
+SPOTIFY_MAX_PLAYLIST_ITEMS_PER_REQUEST = 100
+
+SPOTIFY_RETRYABLE_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+SPOTIFY_OAUTH_SCOPES = (
+    "playlist-read-private",
+    "playlist-read-collaborative",
+    "playlist-modify-private",
+    "playlist-modify-public",
+)
+
+SPOTIFY_OAUTH_REDIRECT_URI = "http://127.0.0.1:9090"
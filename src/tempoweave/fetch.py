@@ -1,29 +1,464 @@
-from typing import Any
+from collections.abc import Iterable, Iterator, Sequence
+from typing import Any, Literal
 
+from abc import ABC, abstractmethod
+from concurrent import futures
 from urllib.parse import urlparse
-import functools as ft
+import csv
+import dataclasses
+import itertools as it
 import logging
+import os
 import pathlib
+import re
+import shutil
+import subprocess
 import tempfile
+import threading
+import time
 
+from spotipy.exceptions import SpotifyException
 from spotipy.oauth2 import SpotifyClientCredentials
-import librosa
 import numpy as np
-import spotipy
-import yt_dlp
+import sqlalchemy as sa
 
-from tempoplay.const import ONE_MINUTE_IN_MILLISECONDS
+from tempoplay.cache import AudioCache, SongCache, TempoCache
+from tempoplay.client import SpotifyClient
+from tempoplay.const import ONE_MINUTE_IN_MILLISECONDS, SNAPSHOT_APPEND_BATCH_SIZE, SPOTIFY_MAX_TRACKS_PER_REQUEST, TEMPO_ESTIMATOR_VERSION
+from tempoplay.metrics import metrics
+from tempoplay.ratelimit import TokenBucket
+from tempoplay.snapshot import SongSnapshot
 from tempoplay.types import SpotifyIDT, SpotifyURIT, SpotifyURLT
 from tempoplay.schema import Song
 
 logger = logging.getLogger(__name__)
 
+type _PipelineStage = Literal["metadata", "download", "analysis"]
+
+_DOWNLOAD_DIR_PREFIX = "tempoweave-"
+
+
+def decode_audio_excerpt(audio_path: pathlib.Path, *, offset: float, duration: float, sample_rate: int) -> np.ndarray:
+    """
+    Decode a mono excerpt of an audio file.
+
+    ffmpeg seeks to .offset and streams raw samples straight into a buffer sized for the
+    excerpt, so the rest of the file is never decoded or held in memory.
+    """
+    command = [
+        "ffmpeg", "-nostdin", "-loglevel", "error",
+        "-ss", f"{offset:.3f}", "-i", pathlib.Path(audio_path).as_posix(), "-t", f"{duration:.3f}",
+        "-vn", "-ac", "1", "-ar", str(sample_rate), "-f", "f32le", "pipe:1",
+    ]
+
+    # Allow one second of slack for container rounding.
+    waveform = np.empty(int((duration + 1) * sample_rate), dtype=np.float32)
+    buffer = memoryview(waveform).cast("B")
+    n_bytes = 0
+
+    with subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE) as proc:
+        assert proc.stdout is not None
+
+        while n_bytes < len(buffer) and (n_read := proc.stdout.readinto(buffer[n_bytes:])):
+            n_bytes += n_read
+
+        # DRAIN ANY OVERRUN SO FFMPEG CAN EXIT CLEANLY.
+        proc.stdout.read()
+        _, stderr = proc.communicate()
+
+    if proc.returncode != 0:
+        raise RuntimeError(f"ffmpeg could not decode '{audio_path}': {stderr.decode().strip()}")
+
+    return waveform[: n_bytes // waveform.itemsize]
+
+
+def load_audio(
+    audio_path: pathlib.Path,
+    *,
+    offset: float = 0.0,
+    duration: float | None = None,
+    sample_rate: int = 22_050,
+) -> np.ndarray:
+    """Decode a mono waveform of an audio file (or an excerpt of it) at .sample_rate."""
+    if duration is not None:
+        return decode_audio_excerpt(audio_path, offset=offset, duration=duration, sample_rate=sample_rate)
+
+    import librosa  # slow to import (numba), only load it once there is audio to analyze.
+
+    song_data, _ = librosa.load(path=audio_path, sr=sample_rate, offset=offset)
+    return song_data
+
+
+@dataclasses.dataclass
+class AudioAnalysis:
+    """The tempo of an audio file, the onset envelope it was estimated from, and how long each step took."""
+
+    tempo: float
+    onset_envelope: np.ndarray
+
+    decoder: str
+    """Which decoder loaded the audio, ffmpeg for excerpts and librosa otherwise."""
+
+    timings: dict[str, float] = dataclasses.field(default_factory=dict)
+    """Seconds spent in each step, keyed by metric stage."""
+
+    def record(self) -> None:
+        """Report the timings to the metrics of the current process."""
+        for stage, seconds in self.timings.items():
+            labels = {"decoder": self.decoder} if stage == "decode" else {}
+            metrics.observe(stage, seconds, **labels)
+
+
+def tempo_from_onset_envelope(onset_envelope: np.ndarray, *, sample_rate: int = 22_050) -> float:
+    """Estimate a tempo from an onset envelope, without the audio it was extracted from."""
+    import librosa
+
+    tempo, _ = librosa.beat.beat_track(onset_envelope=onset_envelope, sr=sample_rate)
+    tempo = tempo.item() if isinstance(tempo, np.ndarray) else tempo
+    return float(tempo)
+
+
+def analyze_audio(
+    audio_path: pathlib.Path,
+    *,
+    offset: float = 0.0,
+    duration: float | None = None,
+    sample_rate: int = 22_050,
+) -> AudioAnalysis:
+    """
+    Estimate the tempo of an audio file (or an excerpt of it), keeping the onset envelope for later.
+
+    This lives at the module level so it can be shipped to a ProcessPoolExecutor. Metrics
+    recorded in a worker process never reach the parent, so each step is timed here and
+    handed back for the caller to .record().
+    """
+    import librosa
+
+    timings = {}
+
+    start = time.perf_counter()
+    song_data = load_audio(audio_path, offset=offset, duration=duration, sample_rate=sample_rate)
+    timings["decode"] = time.perf_counter() - start
+
+    # The same envelope librosa.beat.beat_track() would extract for itself.
+    start = time.perf_counter()
+    onset_envelope = librosa.onset.onset_strength(y=song_data, sr=sample_rate, aggregate=np.median)
+    timings["onset_strength"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    tempo = tempo_from_onset_envelope(onset_envelope, sample_rate=sample_rate)
+    timings["beat_track"] = time.perf_counter() - start
+
+    return AudioAnalysis(
+        tempo=tempo,
+        onset_envelope=onset_envelope,
+        decoder="librosa" if duration is None else "ffmpeg",
+        timings=timings,
+    )
+
+
+def estimate_tempo(
+    audio_path: pathlib.Path,
+    *,
+    offset: float = 0.0,
+    duration: float | None = None,
+    sample_rate: int = 22_050,
+) -> float:
+    """Estimate the tempo of an audio file (or an excerpt of it) using librosa."""
+    analysis = analyze_audio(audio_path, offset=offset, duration=duration, sample_rate=sample_rate)
+    analysis.record()
+    return analysis.tempo
+
+
+def _normalize_name(text: str) -> str:
+    """Reduce an artist or title to a loose matching key."""
+    return re.sub(r"[^0-9a-z]+", "", text.casefold())
+
+
+def _track_key(track_info: dict[str, Any]) -> tuple[str, str]:
+    return _normalize_name(track_info["artists"][0]["name"]), _normalize_name(track_info["name"])
+
+
+@dataclasses.dataclass
+class TempoProviderStats:
+    """Counters describing how a TempoProvider is performing."""
+
+    lookups: int = 0
+    hits: int = 0
+    seconds: float = 0.0
+
+    @property
+    def hit_rate(self) -> float:
+        return self.hits / self.lookups if self.lookups else 0.0
+
+    @property
+    def mean_latency(self) -> float:
+        return self.seconds / self.lookups if self.lookups else 0.0
+
+
+class TempoProvider(ABC):
+    """A source of tempo estimates. Subclasses implement .lookup()."""
+
+    name: str = "provider"
+
+    cheap: bool = True
+    """Whether the provider is fast enough to consult ahead of any download."""
+
+    def __init__(self):
+        self.stats = TempoProviderStats()
+        self._stats_lock = threading.Lock()
+
+    @abstractmethod
+    def lookup(self, track_info: dict[str, Any]) -> tuple[float, str | None] | None:
+        """Return (tempo, source) for a Spotify track, or None if the provider doesn't know it."""
+
+    def __call__(self, track_info: dict[str, Any]) -> tuple[float, str | None] | None:
+        start = time.perf_counter()
+
+        try:
+            found = self.lookup(track_info)
+        except Exception as e:
+            logger.warning(f"Tempo provider '{self.name}' failed for '{track_info['id']}': {e}")
+            found = None
+
+        elapsed = time.perf_counter() - start
+
+        with self._stats_lock:
+            self.stats.lookups += 1
+            self.stats.hits += found is not None
+            self.stats.seconds += elapsed
+
+        metrics.observe("tempo_provider", elapsed, provider=self.name)
+        metrics.increment("tempo_provider_lookups", provider=self.name, result="miss" if found is None else "hit")
+
+        return found
+
+
+class CachedTempoProvider(TempoProvider):
+    """Reads tempo estimates persisted by an earlier run."""
+
+    name = "cache"
+
+    def __init__(self, tempo_cache: TempoCache):
+        super().__init__()
+        self.tempo_cache = tempo_cache
+
+    def lookup(self, track_info: dict[str, Any]) -> tuple[float, str | None] | None:
+        tempo = self.tempo_cache.get(track_info["id"])
+        return None if tempo is None else (tempo, None)
+
+
+class SnapshotTempoProvider(TempoProvider):
+    """Reads the tempo of songs already saved to a SongSnapshot."""
+
+    name = "snapshot"
+
+    def __init__(self, snapshot: SongSnapshot):
+        super().__init__()
+        self.snapshot = snapshot
+
+    def lookup(self, track_info: dict[str, Any]) -> tuple[float, str | None] | None:
+        if track_info["id"] not in self.snapshot:
+            return None
+
+        return self.snapshot.get_song(track_info["id"]).tempo, None
+
+
+class KnownTempoProvider(TempoProvider):
+    """Reads user-supplied BPMs, matched by Spotify track ID or by artist and title."""
+
+    name = "known"
+
+    def __init__(self, rows: Iterable[dict[str, Any]], source: str | None = None):
+        super().__init__()
+        self.source = source
+        self.by_track_id: dict[SpotifyIDT, float] = {}
+        self.by_name: dict[tuple[str, str], float] = {}
+
+        for row in rows:
+            try:
+                tempo = float(row.get("bpm") or row.get("tempo") or "")
+            except (TypeError, ValueError):
+                tempo = float("nan")
+
+            # Also catches NaN, which float() happily parses.
+            if not tempo > 0:
+                logger.warning(f"Skipping a known tempo without a usable BPM: {row}")
+                continue
+
+            if track_id := row.get("track_id"):
+                self.by_track_id[track_id] = tempo
+
+            if (artist := row.get("artist")) and (title := row.get("title")):
+                self.by_name[_normalize_name(artist), _normalize_name(title)] = tempo
+
+    @classmethod
+    def from_csv(cls, path: pathlib.Path | str) -> "KnownTempoProvider":
+        """Load a CSV with a bpm (or tempo) column, plus track_id and/or artist and title columns."""
+        with pathlib.Path(path).open(newline="", encoding="utf-8") as f:
+            return cls(csv.DictReader(f), source=pathlib.Path(path).as_uri())
+
+    @classmethod
+    def from_sqlite(cls, path: pathlib.Path | str, table: str = "tempos") -> "KnownTempoProvider":
+        """Load a SQLite table laid out like .from_csv() expects."""
+        db_engine = sa.create_engine(f"sqlite:///{pathlib.Path(path).as_posix()}")
+
+        try:
+            with db_engine.connect() as conn:
+                known_tempos = sa.Table(table, sa.MetaData(), autoload_with=conn)
+                rows = [dict(row) for row in conn.execute(sa.select(known_tempos)).mappings()]
+        finally:
+            db_engine.dispose()
+
+        return cls(rows, source=pathlib.Path(path).as_uri())
+
+    def lookup(self, track_info: dict[str, Any]) -> tuple[float, str | None] | None:
+        if (tempo := self.by_track_id.get(track_info["id"])) is None:
+            tempo = self.by_name.get(_track_key(track_info))
+
+        return None if tempo is None else (tempo, self.source)
+
+
+class LocalAudioTempoProvider(TempoProvider):
+    """Analyzes local audio files, matched to the track by their artist and title tags."""
+
+    name = "local_audio"
+    cheap = False
+
+    AUDIO_SUFFIXES = frozenset({".aac", ".flac", ".m4a", ".mp3", ".ogg", ".opus", ".wav", ".webm"})
+
+    def __init__(self, music_dir: pathlib.Path | str, **analysis_options: Any):
+        super().__init__()
+        self.music_dir = pathlib.Path(music_dir)
+        self.analysis_options = analysis_options
+        self._files: dict[tuple[str, str], pathlib.Path] | None = None
+        self._files_lock = threading.Lock()
+
+    @staticmethod
+    def _read_tags(path: pathlib.Path) -> tuple[str, str] | None:
+        """Read (artist, title) from a file's tags, falling back to an 'Artist - Title' filename."""
+        try:
+            import mutagen  # optional, only needed to read tags.
+        except ImportError:
+            mutagen = None
+
+        if mutagen is not None and (tags := mutagen.File(path, easy=True)) is not None:
+            if tags.get("artist") and tags.get("title"):
+                return tags["artist"][0], tags["title"][0]
+
+        artist, sep, title = path.stem.partition(" - ")
+        return (artist, title) if sep else None
+
+    @property
+    def files(self) -> dict[tuple[str, str], pathlib.Path]:
+        """Index the music directory once, on first use."""
+        with self._files_lock:
+            if self._files is None:
+                self._files = {}
+
+                for path in self.music_dir.rglob("*"):
+                    if path.suffix.lower() in self.AUDIO_SUFFIXES and (tags := self._read_tags(path)) is not None:
+                        self._files[_normalize_name(tags[0]), _normalize_name(tags[1])] = path
+
+                logger.info(f"Indexed {len(self._files)} local audio files under '{self.music_dir}'")
+
+            return self._files
+
+    def lookup(self, track_info: dict[str, Any]) -> tuple[float, str | None] | None:
+        if (path := self.files.get(_track_key(track_info))) is None:
+            return None
+
+        return estimate_tempo(path, **self.analysis_options), path.as_uri()
+
+
+class OnsetEnvelopeTempoProvider(TempoProvider):
+    """Re-analyzes onset envelopes kept in the AudioCache, so a new estimator doesn't need to download again."""
+
+    name = "onset_envelope"
+    cheap = False
+
+    def __init__(self, song_fetcher: "SongFetcher"):
+        super().__init__()
+        self.song_fetcher = song_fetcher
+
+    def lookup(self, track_info: dict[str, Any]) -> tuple[float, str | None] | None:
+        if self.song_fetcher.audio_cache is None:
+            return None
+
+        feature, sample_rate = self.song_fetcher.onset_envelope_feature(track_info)
+
+        if (onset_envelope := self.song_fetcher.audio_cache.get_features(track_info["id"], feature)) is None:
+            return None
+
+        return tempo_from_onset_envelope(onset_envelope, sample_rate=sample_rate), None
+
+
+class YouTubeTempoProvider(TempoProvider):
+    """Downloads the song from YT and analyzes it. The slowest provider, so it comes last."""
+
+    name = "youtube"
+    cheap = False
+
+    def __init__(self, song_fetcher: "SongFetcher"):
+        super().__init__()
+        self.song_fetcher = song_fetcher
+
+    def lookup(self, track_info: dict[str, Any]) -> tuple[float, str | None] | None:
+        audio_path, source = self.song_fetcher.download_audio_from_yt(track_info, quiet=True)
+
+        try:
+            analysis = analyze_audio(audio_path, **self.song_fetcher.analysis_options(track_info))
+        finally:
+            self.song_fetcher.release_audio(audio_path)
+
+        analysis.record()
+        self.song_fetcher.save_analysis(track_info, analysis)
+        return analysis.tempo, source
+
 
 class SongFetcher:
     """Fetches information about Songs."""
 
-    def __init__(self, spotify_auth: SpotifyClientCredentials):
-        self.spotify = spotipy.Spotify(client_credentials_manager=spotify_auth)
+    def __init__(
+        self,
+        spotify_auth: SpotifyClientCredentials,
+        tempo_cache: TempoCache | None = None,
+        fast_analysis: bool = False,
+        excerpt_duration: float = 60.0,
+        analysis_sample_rate: int = 11_025,
+        rate_limiter: TokenBucket | None = None,
+        api_prefix: str | None = None,
+        song_cache: SongCache | None = None,
+        audio_cache: AudioCache | None = None,
+        tempo_providers: Sequence[TempoProvider] = (),
+        snapshot: SongSnapshot | None = None,
+    ):
+        self.spotify = SpotifyClient(client_credentials_manager=spotify_auth, rate_limiter=rate_limiter, api_prefix=api_prefix)
+        self.song_cache = song_cache if song_cache is not None else SongCache()
+        self.audio_cache = audio_cache
+        self.snapshot = snapshot
+        self.fast_analysis = fast_analysis
+        self.excerpt_duration = excerpt_duration
+        self.analysis_sample_rate = analysis_sample_rate
+
+        # Excerpts at a lower sample rate estimate differently from a full decode, so never share their tempos.
+        if tempo_cache is not None:
+            tempo_cache = tempo_cache.for_estimator(self.estimator_version(tempo_cache.estimator_version))
+
+        self.tempo_cache = tempo_cache
+        self._tracks_in_flight: dict[SpotifyIDT, futures.Future] = {}
+        self._tracks_in_flight_lock = threading.Lock()
+        self._unsaved: dict[SpotifyIDT, Song] = {}
+        self._unsaved_lock = threading.Lock()
+
+        # Consult the persistent caches first, then the caller's providers, and only then YT.
+        self.tempo_providers: list[TempoProvider] = [
+            *([CachedTempoProvider(tempo_cache)] if tempo_cache is not None else []),
+            *([SnapshotTempoProvider(snapshot)] if snapshot is not None else []),
+            *tempo_providers,
+            *([OnsetEnvelopeTempoProvider(self)] if audio_cache is not None else []),
+            YouTubeTempoProvider(self),
+        ]
 
     @staticmethod
     def get_spotify_id(song_identity: SpotifyURIT | SpotifyURLT | SpotifyIDT) -> SpotifyIDT:
@@ -38,78 +473,466 @@ class SongFetcher:
 
         return resource_id
 
-    def estimate_tempo_from_yt(self, track_info: dict[str, Any], quiet: bool = False) -> int:
-        """Download the song from YT and estimate its tempo."""
+    def download_audio_from_yt(self, track_info: dict[str, Any], quiet: bool = False) -> tuple[pathlib.Path, str | None]:
+        """Download the song from YT, returning the audio file and the video it came from."""
+        if self.audio_cache is not None:
+            if (cached := self.audio_cache.get_audio(track_info["id"])) is not None:
+                metrics.increment("cache_lookups", cache="audio", result="hit")
+                return cached
+
+            metrics.increment("cache_lookups", cache="audio", result="miss")
+
+        # Each download gets its own directory, so concurrent workers never collide.
+        temp_dir = tempfile.mkdtemp(prefix=_DOWNLOAD_DIR_PREFIX)
+        temp_mp3 = pathlib.Path(f"{temp_dir}/{track_info['id']}.mp3")
+
+        ydl_opts = {
+            "default_search": "ytsearch1:",
+            "outtmpl": temp_mp3.as_posix().replace(".mp3", ".%(ext)s"),
+            # choco install ffmpeg || pass the path to ffmpeg
+            # 'ffmpeg_location': r"C:\ProgramData\chocolatey\lib\ffmpeg\tools\ffmpeg\bin",
+            "postprocessors": [{"key": "FFmpegExtractAudio", "preferredcodec": "mp3"}],
+            "quiet": quiet,
+        }
+
+        if self.fast_analysis:
+            # KEEP THE NATIVE AUDIO STREAM, WE ONLY EVER DECODE AN EXCERPT OF IT.
+            ydl_opts["format"] = "bestaudio/best"
+            ydl_opts["postprocessors"] = []
+
+        import yt_dlp  # slow to import, only load it once there is something to download.
+
         try:
-            temp_dir = tempfile.gettempdir()
-            temp_mp3 = pathlib.Path(f"{temp_dir}/{track_info['id']}.mp3")
-
-            ydl_opts = {
-                "default_search": "ytsearch1:",
-                "outtmpl": temp_mp3.as_posix().replace(".mp3", ".%(ext)s"),
-                # choco install ffmpeg || pass the path to ffmpeg
-                # 'ffmpeg_location': r"C:\ProgramData\chocolatey\lib\ffmpeg\tools\ffmpeg\bin",
-                "postprocessors": [{"key": "FFmpegExtractAudio", "preferredcodec": "mp3"}],
-                "quiet": quiet,
-            }
-
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+            with metrics.timer("yt_dlp"), yt_dlp.YoutubeDL(ydl_opts) as ydl:
                 artist = track_info["artists"][0]["name"]
                 title  = track_info["name"]
-                ydl.download([f"{artist} {title}"])
+                info = ydl.extract_info(f"{artist} {title}", download=True)
+                entry = next(iter(info.get("entries") or [info]), {})
+        except Exception:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+            raise
 
-            # POST-PROCESS FOR TEMPO USING librosa.
-            song_data, sampling_rate = librosa.load(path=temp_mp3)
-            tempo, _ = librosa.beat.beat_track(y=song_data, sr=sampling_rate)
-            tempo = tempo.item() if isinstance(tempo, np.ndarray) else tempo
-            return int(tempo)
+        if downloads := entry.get("requested_downloads"):
+            audio_path = pathlib.Path(downloads[0]["filepath"])
+        else:
+            audio_path = temp_mp3
 
-        except Exception as e:
-            logger.exception(f"{e}")
-            return 0
+        if self.audio_cache is not None:
+            audio_path = self.audio_cache.put_audio(track_info["id"], audio_path, source=entry.get("webpage_url"))
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+        return audio_path, entry.get("webpage_url")
+
+    @staticmethod
+    def release_audio(audio_path: pathlib.Path) -> None:
+        """Delete a download once it has been analyzed. Audio held by the AudioCache is left alone."""
+        temp_dir = pathlib.Path(audio_path).parent
+
+        if temp_dir.parent == pathlib.Path(tempfile.gettempdir()) and temp_dir.name.startswith(_DOWNLOAD_DIR_PREFIX):
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+    def onset_envelope_feature(self, track_info: dict[str, Any]) -> tuple[str, int]:
+        """Name the cached onset envelope for the part of the song .analysis_options() picks, and its sample rate."""
+        if not (options := self.analysis_options(track_info)):
+            return "onset_envelope", 22_050
+
+        return (
+            f"onset_envelope_{options['sample_rate']}hz_{options['offset']:.1f}s_{options['duration']:.1f}s",
+            options["sample_rate"],
+        )
+
+    def save_analysis(self, track_info: dict[str, Any], analysis: AudioAnalysis) -> None:
+        """Keep the onset envelope of an analyzed song, so it can be re-analyzed without downloading it again."""
+        if self.audio_cache is None:
+            return
+
+        feature, _ = self.onset_envelope_feature(track_info)
+        self.audio_cache.put_features(track_info["id"], feature, analysis.onset_envelope)
+
+    def estimator_version(self, base: str = TEMPO_ESTIMATOR_VERSION) -> str:
+        """Tag an estimator version with how much of each song is analyzed, and at what sample rate."""
+        if not self.fast_analysis:
+            return base
+
+        return f"{base}/fast-{self.analysis_sample_rate}hz-{self.excerpt_duration:g}s"
+
+    def analysis_options(self, track_info: dict[str, Any]) -> dict[str, Any]:
+        """Determine which part of the song to analyze, and at what sample rate."""
+        if not self.fast_analysis:
+            return {}
+
+        # Beat tracking only needs a stable window, so take it from the middle of the song.
+        track_duration = track_info["duration_ms"] / 1000
+        excerpt_duration = min(self.excerpt_duration, track_duration)
+
+        return {
+            "offset": max(0.0, (track_duration - excerpt_duration) / 2),
+            "duration": excerpt_duration,
+            "sample_rate": self.analysis_sample_rate,
+        }
+
+    @property
+    def local_tempo_providers(self) -> list[TempoProvider]:
+        """Every tempo provider short of downloading the song from YT."""
+        return [provider for provider in self.tempo_providers if not isinstance(provider, YouTubeTempoProvider)]
+
+    def lookup_tempo(self, track_info: dict[str, Any], providers: Iterable[TempoProvider] | None = None) -> float | None:
+        """Ask each tempo provider in turn, remembering the first answer in the tempo cache."""
+        for provider in self.tempo_providers if providers is None else providers:
+            if (found := provider(track_info)) is None:
+                continue
+
+            tempo, source = found
+
+            if self.tempo_cache is not None and not isinstance(provider, CachedTempoProvider):
+                self.tempo_cache.set(track_info["id"], tempo, source=source or provider.name)
+
+            return tempo
+
+        return None
+
+    def _lookup_or_download(
+        self,
+        track_info: dict[str, Any],
+        providers: Iterable[TempoProvider],
+        quiet: bool = False,
+    ) -> tuple[float | None, tuple[pathlib.Path, str | None] | None]:
+        """Ask the slower local tempo providers first, downloading the song from YT only if none of them know it."""
+        if (tempo := self.lookup_tempo(track_info, providers)) is not None:
+            return tempo, None
+
+        return None, self.download_audio_from_yt(track_info, quiet=quiet)
+
+    def get_tracks(self, song_identities: Iterable[SpotifyURIT | SpotifyURLT | SpotifyIDT]) -> dict[SpotifyIDT, dict[str, Any] | None]:
+        """
+        Fetch Spotify metadata for many tracks, keyed by track ID.
+
+        Tracks are requested in batches through the multi-track endpoint. Tracks which
+        another thread is already requesting are awaited rather than requested again.
+        Missing tracks map to None.
+        """
+        track_ids = list(dict.fromkeys(self.get_spotify_id(song_identity) for song_identity in song_identities))
+        pending: dict[SpotifyIDT, futures.Future] = {}
+        owned: list[SpotifyIDT] = []
+
+        with self._tracks_in_flight_lock:
+            for track_id in track_ids:
+                if track_id not in self._tracks_in_flight:
+                    self._tracks_in_flight[track_id] = futures.Future()
+                    owned.append(track_id)
+
+                pending[track_id] = self._tracks_in_flight[track_id]
+
+        try:
+            for batch in it.batched(owned, SPOTIFY_MAX_TRACKS_PER_REQUEST):
+                try:
+                    with metrics.timer("spotify", endpoint="tracks"):
+                        r = self.spotify.tracks(list(batch))
+
+                    # Spotify answers in request order, with null for any unknown track.
+                    for track_id, track in zip(batch, r["tracks"], strict=True):
+                        pending[track_id].set_result(track)
+
+                except Exception as e:
+                    for track_id in batch:
+                        if not pending[track_id].done():
+                            pending[track_id].set_exception(e)
+
+        finally:
+            # Even on KeyboardInterrupt, so no other thread waits forever on a future we own.
+            with self._tracks_in_flight_lock:
+                for track_id in owned:
+                    self._tracks_in_flight.pop(track_id, None)
+
+                    if not pending[track_id].done():
+                        pending[track_id].cancel()
+
+        return {track_id: pending[track_id].result() for track_id in track_ids}
 
     def is_song_on_spotify(self, song: Song) -> bool:
         """Determine if a song still exists on Spotify."""
         try:
-            self.spotify.track(song.track_id)
-        except Exception:
-            return False
+            track = self.get_tracks([song.track_id])[song.track_id]
+        except SpotifyException as e:
+            # Only a malformed or unknown ID means the track is gone, rate limits and
+            # server errors have already been retried and should surface to the caller.
+            if e.http_status in (400, 404):
+                return False
+            raise
         else:
-            return True 
+            return track is not None
 
-    @ft.cache
-    def get_song(self, song_identity: SpotifyURIT | SpotifyURLT | SpotifyIDT) -> Song:
-        """Fetch a song."""
-        track_id = self.get_spotify_id(song_identity)
-        track = self.spotify.track(track_id)
-
-        if track is None:
-            raise RuntimeError(f"Could not find a Song for '{song_identity}'")
+    def are_songs_on_spotify(self, songs: Iterable[Song]) -> dict[SpotifyIDT, bool]:
+        """Determine which songs still exist on Spotify, keyed by track ID."""
+        tracks = self.get_tracks(song.track_id for song in songs)
+        return {track_id: track is not None for track_id, track in tracks.items()}
 
-        song = Song(
+    @staticmethod
+    def build_song(track: dict[str, Any], tempo: float) -> Song:
+        """Convert Spotify track metadata into a Song."""
+        return Song(
             track_id=track["id"],
             title=track["name"],
             artist=track["artists"][0]["name"],
             album=track["album"]["name"],
-            tempo=self.estimate_tempo_from_yt(track),
+            tempo=tempo,
             duration=track["duration_ms"] / ONE_MINUTE_IN_MILLISECONDS,
             # genre="",
         )
 
+    def remember(self, song: Song) -> None:
+        """
+        Cache a freshly built Song, queueing it for the snapshot if it is new or has changed.
+
+        Every append rewrites each snapshot column, so queued songs are written together
+        once SNAPSHOT_APPEND_BATCH_SIZE have built up, or whenever .flush_snapshot() is called.
+        """
+        self.song_cache.set(song.track_id, song)
+
+        if self.snapshot is None:
+            return
+
+        if song.track_id in self.snapshot and self.snapshot.get_song(song.track_id) == song:
+            return
+
+        with self._unsaved_lock:
+            self._unsaved[song.track_id] = song
+            is_full = len(self._unsaved) >= SNAPSHOT_APPEND_BATCH_SIZE
+
+        if is_full:
+            self.flush_snapshot()
+
+    def flush_snapshot(self) -> int:
+        """Append every queued Song to the snapshot, returning how many were written."""
+        if self.snapshot is None:
+            return 0
+
+        # Hold the lock across the append, so songs reach the snapshot in the order they were queued.
+        with self._unsaved_lock:
+            songs, self._unsaved = list(self._unsaved.values()), {}
+            return self.snapshot.append(songs)
+
+    def get_song(self, song_identity: SpotifyURIT | SpotifyURLT | SpotifyIDT) -> Song:
+        """Fetch a song."""
+        try:
+            return self._fetch_song(song_identity)
+        finally:
+            self.flush_snapshot()
+
+    def _fetch_song(self, song_identity: SpotifyURIT | SpotifyURLT | SpotifyIDT) -> Song:
+        track_id = self.get_spotify_id(song_identity)
+
+        try:
+            song = self.song_cache[track_id]
+        except KeyError:
+            metrics.increment("cache_lookups", cache="song", result="miss")
+        else:
+            metrics.increment("cache_lookups", cache="song", result="hit")
+
+            if song is None:
+                raise RuntimeError(f"Could not find a Song for '{song_identity}'")
+            return song
+
+        with metrics.timer("get_song", step="metadata"):
+            track = self.get_tracks([track_id])[track_id]
+
+        if track is None:
+            self.song_cache.set_missing(track_id)
+            raise RuntimeError(f"Could not find a Song for '{song_identity}'")
+
+        with metrics.timer("get_song", step="tempo"):
+            tempo = self.lookup_tempo(track)
+
+        if tempo is None:
+            metrics.increment("failures", stage="get_song")
+            raise RuntimeError(f"Could not estimate a tempo for '{song_identity}'")
+
+        song = self.build_song(track, tempo=tempo)
+        self.remember(song)
         return song
 
-    def get_songs_from_playlist(self, playlist_identity: SpotifyURIT | SpotifyURLT | SpotifyIDT) -> list[Song]:
-        """Fetch all songs from a playlist."""
+    def stream_songs(
+        self,
+        song_identities: Iterable[SpotifyURIT | SpotifyURLT | SpotifyIDT],
+        *,
+        metadata_workers: int = 4,
+        download_workers: int = 4,
+        analysis_workers: int | None = None,
+        max_in_flight: int | None = None,
+        quiet: bool = True,
+    ) -> Iterator[Song]:
+        """
+        Fetch many songs concurrently, yielding each one as soon as it is ready.
+
+        Spotify lookups and YT downloads are network-bound and run on their own thread
+        pools, while tempo estimation is CPU-bound and runs on a process pool sized to
+        the machine (or .analysis_workers). Cheap tempo providers are asked as soon as
+        the metadata arrives, the slower local ones (such as local audio files) on the
+        download threads, and a song is only downloaded once every provider has missed.
+        Songs which fail at any stage are logged and skipped.
+
+        .song_identities is consumed lazily; no more than .max_in_flight tasks are
+        queued across all stages at once. Closing the stream early cancels every queued
+        task and only waits for those already running.
+        """
+        analysis_workers = analysis_workers or os.cpu_count() or 1
+        cheap_providers = [p for p in self.tempo_providers if p.cheap and not isinstance(p, CachedTempoProvider)]
+        slow_providers = [p for p in self.local_tempo_providers if not p.cheap]
+        max_in_flight = max_in_flight or 2 * (metadata_workers + download_workers + analysis_workers)
+        batches = it.batched(song_identities, SPOTIFY_MAX_TRACKS_PER_REQUEST)
+
+        with (
+            futures.ThreadPoolExecutor(metadata_workers, thread_name_prefix="tempoweave-metadata") as metadata_pool,
+            futures.ThreadPoolExecutor(download_workers, thread_name_prefix="tempoweave-download") as download_pool,
+            futures.ProcessPoolExecutor(analysis_workers) as analysis_pool,
+        ):
+            in_flight: dict[futures.Future, tuple[_PipelineStage, Any]] = {}
+
+            try:
+                while True:
+                    while batches is not None and len(in_flight) < max_in_flight:
+                        if (batch := next(batches, None)) is None:
+                            batches = None
+                            break
+
+                        in_flight[metadata_pool.submit(self.get_tracks, batch)] = ("metadata", batch)
+
+                    if not in_flight:
+                        break
+
+                    done, _ = futures.wait(in_flight, return_when=futures.FIRST_COMPLETED)
+
+                    for future in done:
+                        stage, context = in_flight.pop(future)
+
+                        try:
+                            result = future.result()
+
+                            if stage == "metadata":
+                                tracks = {track_id: track for track_id, track in result.items() if track is not None}
+
+                                if missing := result.keys() - tracks.keys():
+                                    logger.warning(f"Could not find a Song for {sorted(missing)}")
+
+                                    for track_id in missing:
+                                        self.song_cache.set_missing(track_id)
+
+                                cached = {} if self.tempo_cache is None else self.tempo_cache.get_many(list(tracks))
+
+                                for track_id, track in tracks.items():
+                                    if track_id not in cached and (tempo := self.lookup_tempo(track, cheap_providers)) is not None:
+                                        cached[track_id] = tempo
+
+                                    if track_id in cached:
+                                        song = self.build_song(track, tempo=cached[track_id])
+                                        self.remember(song)
+                                        yield song
+                                        continue
+
+                                    next_future = download_pool.submit(self._lookup_or_download, track, slow_providers, quiet=quiet)
+                                    in_flight[next_future] = ("download", track)
+
+                            elif stage == "download":
+                                tempo, download = result
+
+                                if download is None:
+                                    song = self.build_song(context, tempo=tempo)
+                                    self.remember(song)
+                                    yield song
+                                    continue
+
+                                audio_path, source = download
+                                next_future = analysis_pool.submit(analyze_audio, audio_path, **self.analysis_options(context))
+                                in_flight[next_future] = ("analysis", (context, audio_path, source))
+
+                            else:
+                                track, _, source = context
+                                result.record()
+                                self.save_analysis(track, result)
+
+                                if self.tempo_cache is not None:
+                                    self.tempo_cache.set(track["id"], result.tempo, source=source)
+
+                                song = self.build_song(track, tempo=result.tempo)
+                                self.remember(song)
+                                yield song
+
+                        except Exception as e:
+                            logger.exception(f"Failed to fetch song during {stage}: {e}")
+
+                        finally:
+                            if stage == "analysis":
+                                self.release_audio(context[1])
+
+            finally:
+                # STOPPED EARLY? DROP THE QUEUED WORK, AND ANY AUDIO WHICH WILL NEVER BE ANALYZED.
+                for pool in (metadata_pool, download_pool, analysis_pool):
+                    pool.shutdown(wait=True, cancel_futures=True)
+
+                for future, (stage, context) in in_flight.items():
+                    if stage == "analysis":
+                        self.release_audio(context[1])
+                    elif stage == "download" and not future.cancelled() and future.exception() is None:
+                        if (download := future.result()[1]) is not None:
+                            self.release_audio(download[0])
+
+                self.flush_snapshot()
+
+    def iter_playlist_items(self, playlist_identity: SpotifyURIT | SpotifyURLT | SpotifyIDT) -> Iterator[dict[str, Any]]:
+        """Walk every page of a playlist, prefetching the next page while this one is consumed."""
         playlist_id = self.get_spotify_id(playlist_identity)
-        playlist = self.spotify.playlist(playlist_id)
+        page = self.spotify.playlist_items(playlist_id, additional_types=("track",))
+
+        if page is None:
+            raise RuntimeError(f"Could not find a Playlist for '{playlist_identity}'")
 
-        if playlist is None:
-            raise RuntimeError(f"Could not find a Song for '{playlist_identity}'")
+        with futures.ThreadPoolExecutor(1, thread_name_prefix="tempoweave-paginate") as pool:
+            while page is not None:
+                next_page = pool.submit(self.spotify.next, page) if page.get("next") else None
+                yield from page["items"]
+                page = None if next_page is None else next_page.result()
 
-        songs: list[Song] = []
+    def iter_playlist_track_ids(self, playlist_identity: SpotifyURIT | SpotifyURLT | SpotifyIDT) -> Iterator[SpotifyIDT]:
+        """Walk every track ID in a playlist."""
+        for playlist_item in self.iter_playlist_items(playlist_identity):
+            # Local files and tracks removed from Spotify have no usable track ID.
+            if (track := playlist_item.get("track")) is None or track.get("id") is None:
+                continue
+
+            yield track["id"]
+
+    def iter_songs_from_playlist(
+        self,
+        playlist_identity: SpotifyURIT | SpotifyURLT | SpotifyIDT,
+        pipelined: bool = False,
+        **pipeline_options: Any,
+    ) -> Iterator[Song]:
+        """Stream all songs from a playlist, in playlist order unless pipelined."""
+        track_ids = self.iter_playlist_track_ids(playlist_identity)
+
+        if pipelined:
+            yield from self.stream_songs(track_ids, **pipeline_options)
+            return
+
+        try:
+            for track_id in track_ids:
+                yield self._fetch_song(track_id)
+        finally:
+            self.flush_snapshot()
+
+    def get_songs_from_playlist(
+        self,
+        playlist_identity: SpotifyURIT | SpotifyURLT | SpotifyIDT,
+        pipelined: bool = False,
+        **pipeline_options: Any,
+    ) -> list[Song]:
+        """Fetch all songs from a playlist."""
+        if not pipelined:
+            return list(self.iter_songs_from_playlist(playlist_identity))
 
-        for playlist_item in playlist["tracks"]["items"]:
-            track_id = playlist_item["track"]["id"]
-            songs.append(self.get_song(track_id))
+        track_ids = list(self.iter_playlist_track_ids(playlist_identity))
 
-        return songs
+        # RESTORE THE PLAYLIST ORDER, SONGS ARRIVE IN ORDER OF COMPLETION.
+        position = {track_id: idx for idx, track_id in enumerate(track_ids)}
+        songs = self.stream_songs(track_ids, **pipeline_options)
+        return sorted(songs, key=lambda song: position.get(song.track_id, len(position)))
@@ -0,0 +1,114 @@
+from collections.abc import Iterable, Iterator
+
+import bisect
+import logging
+
+from tempoplay.schema import Song
+from tempoplay.types import SpotifyIDT
+
+logger = logging.getLogger(__name__)
+
+type _IndexKeyT = tuple[float, SpotifyIDT]
+
+
+class TempoIndex:
+    """
+    A sorted index of Songs by tempo, then by duration.
+
+    Song.tempo is floored to multiples of 5 BPM, so songs are bucketed by their exact
+    tempo and each bucket is kept sorted by (duration, track_id). Finding the buckets
+    for a tempo range and the right duration within a bucket are both binary searches,
+    and songs can be added or removed at any time without rebuilding the index.
+
+    Queries never skip songs, so discard songs once they are used. Take a .copy() first
+    to keep the original index intact.
+    """
+
+    def __init__(self, songs: Iterable[Song] = ()):
+        self._songs: dict[SpotifyIDT, Song] = {song.track_id: song for song in songs}
+        self._buckets: dict[int, list[_IndexKeyT]] = {}
+
+        # Bulk load with one sort per bucket, rather than an insort per song.
+        for song in self._songs.values():
+            self._buckets.setdefault(song.tempo, []).append((song.duration, song.track_id))
+
+        for bucket in self._buckets.values():
+            bucket.sort()
+
+        self._tempos: list[int] = sorted(self._buckets)
+
+    def __len__(self) -> int:
+        return len(self._songs)
+
+    def __contains__(self, track_id: SpotifyIDT) -> bool:
+        return track_id in self._songs
+
+    def __iter__(self) -> Iterator[Song]:
+        """Walk every song, by tempo then duration."""
+        for tempo in self._tempos:
+            for _, track_id in self._buckets[tempo]:
+                yield self._songs[track_id]
+
+    def copy(self) -> "TempoIndex":
+        """Copy the index, so songs can be discarded from one without touching the other."""
+        index = TempoIndex()
+        index._songs = self._songs.copy()
+        index._tempos = self._tempos.copy()
+        index._buckets = {tempo: bucket.copy() for tempo, bucket in self._buckets.items()}
+        return index
+
+    def add(self, song: Song) -> None:
+        """Index a song, replacing any previous version of it."""
+        if song.track_id in self._songs:
+            self.discard(song.track_id)
+
+        if (bucket := self._buckets.get(song.tempo)) is None:
+            bucket = self._buckets[song.tempo] = []
+            bisect.insort(self._tempos, song.tempo)
+
+        bisect.insort(bucket, (song.duration, song.track_id))
+        self._songs[song.track_id] = song
+
+    def discard(self, track_id: SpotifyIDT) -> None:
+        """Remove a song from the index, if it's there."""
+        if (song := self._songs.pop(track_id, None)) is None:
+            return
+
+        bucket = self._buckets[song.tempo]
+        del bucket[bisect.bisect_left(bucket, (song.duration, song.track_id))]
+
+        if not bucket:
+            del self._buckets[song.tempo]
+            del self._tempos[bisect.bisect_left(self._tempos, song.tempo)]
+
+    def _tempos_in_range(self, min_tempo: int, max_tempo: int) -> list[int]:
+        lo = bisect.bisect_left(self._tempos, min_tempo)
+        hi = bisect.bisect_left(self._tempos, max_tempo)
+        return self._tempos[lo:hi]
+
+    def songs_in_range(self, min_tempo: int, max_tempo: int) -> Iterator[Song]:
+        """Walk all songs with a tempo in [min_tempo, max_tempo), by tempo then duration."""
+        for tempo in self._tempos_in_range(min_tempo, max_tempo):
+            for _, track_id in self._buckets[tempo]:
+                yield self._songs[track_id]
+
+    def best_fit(self, remaining: float, min_tempo: int, max_tempo: int) -> Song | None:
+        """Find the longest song in [min_tempo, max_tempo) which still fits within .remaining minutes."""
+        best: Song | None = None
+
+        for tempo in self._tempos_in_range(min_tempo, max_tempo):
+            bucket = self._buckets[tempo]
+
+            # The longest song that fits sorts just before any longer one.
+            if (idx := bisect.bisect_right(bucket, (remaining, chr(0x10FFFF))) - 1) < 0:
+                continue
+
+            duration, track_id = bucket[idx]
+
+            if best is None or duration > best.duration:
+                best = self._songs[track_id]
+
+            if duration == remaining:
+                break
+
+        return best
@@ -0,0 +1,220 @@
+from collections.abc import Iterable, Iterator
+from typing import Any
+
+import logging
+
+import numpy as np
+
+from tempoplay.schema import Song
+from tempoplay.types import SpotifyIDT
+
+logger = logging.getLogger(__name__)
+
+# Spotify track IDs are 22 base-62 characters.
+_TRACK_ID_DTYPE = np.dtype("U22")
+_MISSING_CODE = -1
+
+
+class Vocabulary:
+    """Interns strings as small integer codes."""
+
+    __slots__ = ("codes", "values")
+
+    def __init__(self, values: Iterable[str] = ()):
+        self.values: list[str] = []
+        self.codes: dict[str, int] = {}
+
+        for value in values:
+            self.encode(value)
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def encode(self, value: str | None) -> int:
+        """Return the code for a value, interning it if it's new."""
+        if value is None:
+            return _MISSING_CODE
+
+        if (code := self.codes.get(value)) is None:
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+
+        return code
+
+    def decode(self, code: int) -> str | None:
+        """Return the value for a code."""
+        return None if code == _MISSING_CODE else self.values[code]
+
+
+class SongLibrary:
+    """
+    A columnar collection of Songs.
+
+    Each field lives in its own NumPy array (artist, album and genre as interned codes),
+    so bulk planning can filter and aggregate without touching Song instances. Songs are
+    only built when they are read back out. Track IDs are unique; adding a known track
+    replaces its row.
+    """
+
+    def __init__(self, capacity: int = 1024):
+        self._size = 0
+        self._positions: dict[SpotifyIDT, int] = {}
+        self.titles: list[str] = []
+        self.artists = Vocabulary()
+        self.albums = Vocabulary()
+        self.genres = Vocabulary()
+
+        self._track_ids = np.empty(capacity, dtype=_TRACK_ID_DTYPE)
+        self._tempos = np.empty(capacity, dtype=np.int32)
+        self._durations = np.empty(capacity, dtype=np.float64)
+        self._artist_codes = np.empty(capacity, dtype=np.int32)
+        self._album_codes = np.empty(capacity, dtype=np.int32)
+        self._genre_codes = np.empty(capacity, dtype=np.int32)
+
+    @classmethod
+    def from_songs(cls, songs: Iterable[Song]) -> "SongLibrary":
+        """Build a library from Song models."""
+        songs = list(songs)
+        library = cls(capacity=max(len(songs), 1))
+        library.extend(songs)
+        return library
+
+    # COLUMN VIEWS, TRIMMED TO THE NUMBER OF SONGS IN THE LIBRARY.
+
+    @property
+    def track_ids(self) -> np.ndarray:
+        return self._track_ids[: self._size]
+
+    @property
+    def tempos(self) -> np.ndarray:
+        return self._tempos[: self._size]
+
+    @property
+    def durations(self) -> np.ndarray:
+        return self._durations[: self._size]
+
+    @property
+    def artist_codes(self) -> np.ndarray:
+        return self._artist_codes[: self._size]
+
+    @property
+    def album_codes(self) -> np.ndarray:
+        return self._album_codes[: self._size]
+
+    @property
+    def genre_codes(self) -> np.ndarray:
+        return self._genre_codes[: self._size]
+
+    def _reserve(self, capacity: int) -> None:
+        """Grow every column to hold at least .capacity songs."""
+        if capacity <= len(self._tempos):
+            return
+
+        capacity = max(capacity, 2 * len(self._tempos))
+
+        for name in ("_track_ids", "_tempos", "_durations", "_artist_codes", "_album_codes", "_genre_codes"):
+            column = getattr(self, name)
+            grown = np.empty(capacity, dtype=column.dtype)
+            grown[: self._size] = column[: self._size]
+            setattr(self, name, grown)
+
+    def add(self, song: Song) -> int:
+        """Add a song, returning its row."""
+        if (row := self._positions.get(song.track_id)) is None:
+            self._reserve(self._size + 1)
+            row = self._size
+            self._size += 1
+            self._positions[song.track_id] = row
+            self.titles.append(song.title)
+        else:
+            self.titles[row] = song.title
+
+        self._track_ids[row] = song.track_id
+        self._tempos[row] = song.tempo
+        self._durations[row] = song.duration
+        self._artist_codes[row] = self.artists.encode(song.artist)
+        self._album_codes[row] = self.albums.encode(song.album)
+        self._genre_codes[row] = self.genres.encode(song.genre)
+        return row
+
+    def extend(self, songs: Iterable[Song]) -> None:
+        """Add many songs."""
+        for song in songs:
+            self.add(song)
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __contains__(self, track_id: SpotifyIDT) -> bool:
+        return track_id in self._positions
+
+    def __iter__(self) -> Iterator[Song]:
+        for row in range(self._size):
+            yield self.song_at(row)
+
+    def row_of(self, track_id: SpotifyIDT) -> int:
+        """Find the row a track is stored in."""
+        return self._positions[track_id]
+
+    def _row(self, row: int) -> dict[str, Any]:
+        if not 0 <= row < self._size:
+            raise IndexError(f"row {row} is out of range for a library of {self._size} songs")
+
+        return {
+            "track_id": str(self._track_ids[row]),
+            "title": self.titles[row],
+            "artist": self.artists.decode(int(self._artist_codes[row])),
+            "album": self.albums.decode(int(self._album_codes[row])),
+            "tempo": int(self._tempos[row]),
+            "duration": float(self._durations[row]),
+            "genre": self.genres.decode(int(self._genre_codes[row])),
+        }
+
+    def song_at(self, row: int) -> Song:
+        """Build the Song stored in a row."""
+        # Every row came from a validated Song, so there's no need to validate it again.
+        return Song.from_trusted_rows([self._row(row)])[0]
+
+    def get_song(self, track_id: SpotifyIDT) -> Song:
+        """Build the Song for a track."""
+        return self.song_at(self.row_of(track_id))
+
+    def to_songs(self, rows: Iterable[int] | None = None) -> list[Song]:
+        """Build Songs for the given rows, or the whole library."""
+        rows = range(self._size) if rows is None else rows
+        return Song.from_trusted_rows(self._row(int(row)) for row in rows)
+
+    def tempo_mask(self, min_tempo: int | None = None, max_tempo: int | None = None) -> np.ndarray:
+        """Select songs with a tempo in [min_tempo, max_tempo)."""
+        mask = np.ones(self._size, dtype=bool)
+
+        if min_tempo is not None:
+            mask &= self.tempos >= min_tempo
+
+        if max_tempo is not None:
+            mask &= self.tempos < max_tempo
+
+        return mask
+
+    def duration_mask(self, min_duration: float | None = None, max_duration: float | None = None) -> np.ndarray:
+        """Select songs with a duration (in minutes) in [min_duration, max_duration]."""
+        mask = np.ones(self._size, dtype=bool)
+
+        if min_duration is not None:
+            mask &= self.durations >= min_duration
+
+        if max_duration is not None:
+            mask &= self.durations <= max_duration
+
+        return mask
+
+    def filter(
+        self,
+        min_tempo: int | None = None,
+        max_tempo: int | None = None,
+        min_duration: float | None = None,
+        max_duration: float | None = None,
+    ) -> np.ndarray:
+        """Return the rows of all songs matching the tempo and duration bounds."""
+        mask = self.tempo_mask(min_tempo, max_tempo) & self.duration_mask(min_duration, max_duration)
+        return np.flatnonzero(mask)
@@ -0,0 +1,231 @@
+from collections.abc import Callable, Iterator
+from typing import Any
+
+import bisect
+import contextlib
+import dataclasses
+import functools as ft
+import json
+import logging
+import os
+import pathlib
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+type _MetricKeyT = tuple[str, tuple[tuple[str, str], ...]]
+
+# Upper bounds (in seconds) of the stage duration histogram buckets.
+_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, float("inf"))
+
+_DISABLED_TIMER = contextlib.nullcontext()
+
+
+@dataclasses.dataclass
+class StageTimings:
+    """A histogram of how long a stage took."""
+
+    count: int = 0
+    seconds: float = 0.0
+    max_seconds: float = 0.0
+    buckets: list[int] = dataclasses.field(default_factory=lambda: [0] * len(_BUCKETS))
+
+    def observe(self, seconds: float) -> None:
+        self.count += 1
+        self.seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+        self.buckets[bisect.bisect_left(_BUCKETS, seconds)] += 1
+
+
+class Metrics:
+    """
+    Stage timers and event counters for finding where a build spends its time.
+
+    While disabled, .timer() hands back a shared no-op context manager and .increment()
+    returns straight away, so instrumented code pays a single attribute check. Metrics
+    are process-local; work shipped to a ProcessPoolExecutor has to hand its timings
+    back for the parent to .observe().
+    """
+
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self.stages: dict[_MetricKeyT, StageTimings] = {}
+        self.counters: dict[_MetricKeyT, float] = {}
+        self._lock = threading.Lock()
+
+    def enable(self) -> None:
+        self.enabled = True
+
+    def disable(self) -> None:
+        self.enabled = False
+
+    def reset(self) -> None:
+        """Forget everything recorded so far."""
+        with self._lock:
+            self.stages.clear()
+            self.counters.clear()
+
+    @staticmethod
+    def _key(name: str, labels: dict[str, Any]) -> _MetricKeyT:
+        return name, tuple(sorted((label, str(value)) for label, value in labels.items()))
+
+    def observe(self, stage: str, seconds: float, **labels: Any) -> None:
+        """Record how long a stage took."""
+        if not self.enabled:
+            return
+
+        key = self._key(stage, labels)
+
+        with self._lock:
+            if (timings := self.stages.get(key)) is None:
+                timings = self.stages[key] = StageTimings()
+
+            timings.observe(seconds)
+
+    def increment(self, counter: str, amount: float = 1, **labels: Any) -> None:
+        """Count an event, such as a cache hit or a retry."""
+        if not self.enabled:
+            return
+
+        key = self._key(counter, labels)
+
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def timer(self, stage: str, **labels: Any) -> contextlib.AbstractContextManager[None]:
+        """Time the body of a with-block as a stage."""
+        if not self.enabled:
+            return _DISABLED_TIMER
+
+        return self._timer(stage, labels)
+
+    @contextlib.contextmanager
+    def _timer(self, stage: str, labels: dict[str, Any]) -> Iterator[None]:
+        start = time.perf_counter()
+
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start, **labels)
+
+    def timed[F: Callable[..., Any]](self, stage: str, **labels: Any) -> Callable[[F], F]:
+        """Time every call to the decorated function as a stage."""
+        def decorator(fn: F) -> F:
+            @ft.wraps(fn)
+            def wrapper(*args: Any, **kwargs: Any) -> Any:
+                if not self.enabled:
+                    return fn(*args, **kwargs)
+
+                start = time.perf_counter()
+
+                try:
+                    return fn(*args, **kwargs)
+                finally:
+                    self.observe(stage, time.perf_counter() - start, **labels)
+
+            return wrapper  # type: ignore[return-value]
+
+        return decorator
+
+    # EXPORTERS.
+
+    @staticmethod
+    def _format_labels(labels: tuple[tuple[str, str], ...], **extra: str) -> str:
+        pairs = [*labels, *extra.items()]
+
+        if not pairs:
+            return ""
+
+        escaped = (f'{name}="{json.dumps(value, ensure_ascii=False)[1:-1]}"' for name, value in pairs)
+        return "{" + ",".join(escaped) + "}"
+
+    def to_prometheus(self) -> str:
+        """Render every metric in the Prometheus text exposition format."""
+        with self._lock:
+            stages = {key: dataclasses.replace(timings, buckets=list(timings.buckets)) for key, timings in self.stages.items()}
+            counters = dict(self.counters)
+
+        lines: list[str] = []
+
+        if stages:
+            lines.append("# HELP tempoweave_stage_seconds Time spent in each stage of a build.")
+            lines.append("# TYPE tempoweave_stage_seconds histogram")
+
+        for (stage, labels), timings in sorted(stages.items()):
+            labels = (("stage", stage), *labels)
+            cumulative = 0
+
+            for bound, count in zip(_BUCKETS, timings.buckets):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"tempoweave_stage_seconds_bucket{self._format_labels(labels, le=le)} {cumulative}")
+
+            lines.append(f"tempoweave_stage_seconds_sum{self._format_labels(labels)} {timings.seconds}")
+            lines.append(f"tempoweave_stage_seconds_count{self._format_labels(labels)} {timings.count}")
+
+        for name in sorted({name for name, _ in counters}):
+            lines.append(f"# TYPE tempoweave_{name}_total counter")
+
+            for (counter, labels), value in sorted(counters.items()):
+                if counter == name:
+                    lines.append(f"tempoweave_{name}_total{self._format_labels(labels)} {value}")
+
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path: pathlib.Path | str) -> None:
+        """Write a Prometheus text file, e.g. for node_exporter's textfile collector."""
+        path = pathlib.Path(path)
+        temp = path.with_suffix(f"{path.suffix}.{os.getpid()}.tmp")
+        temp.write_text(self.to_prometheus(), encoding="utf-8")
+
+        # Scrapers must never see a half-written file.
+        os.replace(temp, path)
+
+    def to_records(self) -> list[dict[str, Any]]:
+        """Snapshot every metric as a flat record."""
+        now = time.time()
+
+        with self._lock:
+            records = [
+                {
+                    "ts": now,
+                    "type": "stage",
+                    "name": stage,
+                    "labels": dict(labels),
+                    "count": timings.count,
+                    "seconds": timings.seconds,
+                    "mean_seconds": timings.seconds / timings.count,
+                    "max_seconds": timings.max_seconds,
+                }
+                for (stage, labels), timings in self.stages.items()
+            ]
+            records.extend(
+                {"ts": now, "type": "counter", "name": counter, "labels": dict(labels), "value": value}
+                for (counter, labels), value in self.counters.items()
+            )
+
+        return records
+
+    def write_jsonl(self, path: pathlib.Path | str) -> None:
+        """Append a snapshot of every metric to a JSON-lines file."""
+        with pathlib.Path(path).open("a", encoding="utf-8") as f:
+            for record in self.to_records():
+                f.write(json.dumps(record) + "\n")
+
+    def log_summary(self, level: int = logging.INFO) -> None:
+        """Log each stage's total time, slowest first."""
+        with self._lock:
+            stages = sorted(self.stages.items(), key=lambda item: item[1].seconds, reverse=True)
+
+        for (stage, labels), timings in stages:
+            suffix = "".join(f" {name}={value}" for name, value in labels)
+            logger.log(
+                level,
+                f"{stage}{suffix}: {timings.count} calls, {timings.seconds:.2f}s total, "
+                f"{timings.seconds / timings.count * 1000:.1f}ms mean, {timings.max_seconds * 1000:.1f}ms max",
+            )
+
+
+metrics = Metrics(enabled=os.environ.get("TEMPOWEAVE_METRICS", "").lower() in ("1", "true", "yes"))
+"""The process-wide metrics registry. Set TEMPOWEAVE_METRICS=1 or call metrics.enable()."""
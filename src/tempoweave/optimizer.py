@@ -0,0 +1,584 @@
+from collections.abc import Sequence
+from typing import Any, Literal
+
+from concurrent import futures
+import bisect
+import dataclasses
+import logging
+import math
+import multiprocessing
+import os
+import random
+import threading
+import time
+
+import numpy as np
+
+from tempoplay.index import TempoIndex
+from tempoplay.library import SongLibrary
+from tempoplay.schedule import TempoRange, calculate_tempo_schedule
+from tempoplay.schema import Song, TempoPlaylistSettings
+from tempoplay.types import SpotifyIDT
+
+logger = logging.getLogger(__name__)
+
+type InitialSelectionT = Literal["subset_sum", "greedy"]
+type StopReasonT = Literal["max_iterations", "plateau", "target", "cancelled"]
+
+# Song.duration is rounded to a tenth of a minute, so durations are exact in these units.
+_DURATION_QUANTUM = 0.1
+
+
+@dataclasses.dataclass
+class TempoDistribution:
+    """Represents how well a playlist fills a single TempoRange."""
+
+    required_duration: float
+    actual_duration: float
+    song_count: int
+    deficit: float
+    songs: list[Song]
+
+
+@dataclasses.dataclass
+class ChainStats:
+    """Represents how a single annealing chain went."""
+
+    seed: int | None
+    iterations: int
+    initial_fitness: float
+    best_fitness: float
+    stopped: StopReasonT
+    seconds: float
+
+
+@dataclasses.dataclass
+class PlaylistResult:
+    """Represents a generated playlist."""
+
+    songs: list[Song]
+    total_duration: float
+    target_duration: float
+    tempo_distribution: dict[TempoRange, TempoDistribution]
+    fitness_score: float
+    chains: list[ChainStats] = dataclasses.field(default_factory=list)
+    """Every annealing chain which was run, the one that produced .songs included."""
+
+
+class _IndexedPool:
+    """A set of song indices supporting O(1) add, remove and random choice."""
+
+    __slots__ = ("items", "positions")
+
+    def __init__(self, items: Sequence[int] = ()):
+        self.items: list[int] = list(items)
+        self.positions: dict[int, int] = {item: idx for idx, item in enumerate(self.items)}
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def __contains__(self, item: int) -> bool:
+        return item in self.positions
+
+    def add(self, item: int) -> None:
+        if item in self.positions:
+            return
+        self.positions[item] = len(self.items)
+        self.items.append(item)
+
+    def remove(self, item: int) -> None:
+        # Swap the last item into the hole, so removal never shifts the list.
+        idx = self.positions.pop(item)
+        last = self.items.pop()
+
+        if last != item:
+            self.items[idx] = last
+            self.positions[last] = idx
+
+    def choice(self, rng: random.Random) -> int:
+        return self.items[rng.randrange(len(self.items))]
+
+
+class _PlaylistState:
+    """
+    The playlist under optimization, with its fitness terms maintained incrementally.
+
+    Songs are referred to by their index in the library. Each move touches at most two
+    tempo ranges, so its effect on fitness is computed in O(1) from the per-range sums.
+    """
+
+    def __init__(self, optimizer: "PlaylistOptimizer", durations: list[float], song_ranges: list[int], allow_duplicates: bool):
+        self.optimizer = optimizer
+        self.durations = durations
+        self.song_ranges = song_ranges
+        self.allow_duplicates = allow_duplicates
+        self.required = [r.required_duration for r in optimizer.tempo_ranges]
+        self.actual = [0.0] * len(self.required)
+        self.total_error = sum(self.required)
+        self.total_actual = 0.0
+
+        # .slots may hold the same song more than once when duplicates are allowed.
+        self.slots: list[int] = []
+        self.unused = [_IndexedPool() for _ in self.required]
+
+        for song_idx, range_idx in enumerate(song_ranges):
+            self.unused[range_idx].add(song_idx)
+
+    def fitness(self, total_error: float | None = None, total_actual: float | None = None) -> float:
+        """Calculate how well the playlist matches the target distribution."""
+        total_error = self.total_error if total_error is None else total_error
+        total_actual = self.total_actual if total_actual is None else total_actual
+        return self.optimizer.fitness(total_error=total_error, total_actual=total_actual)
+
+    def delta(self, removed: int | None, added: int | None) -> tuple[float, float]:
+        """Calculate (total_error, total_actual) after removing and/or adding a song."""
+        changes: dict[int, float] = {}
+
+        if removed is not None:
+            changes[self.song_ranges[removed]] = -self.durations[removed]
+
+        if added is not None:
+            r = self.song_ranges[added]
+            changes[r] = changes.get(r, 0.0) + self.durations[added]
+
+        total_error = self.total_error
+        total_actual = self.total_actual
+
+        for r, change in changes.items():
+            total_error += abs(self.required[r] - self.actual[r] - change) - abs(self.required[r] - self.actual[r])
+            total_actual += change
+
+        return total_error, total_actual
+
+    def add(self, song_idx: int) -> None:
+        r = self.song_ranges[song_idx]
+        self.total_error, self.total_actual = self.delta(None, song_idx)
+        self.actual[r] += self.durations[song_idx]
+        self.slots.append(song_idx)
+
+        if not self.allow_duplicates:
+            self.unused[r].remove(song_idx)
+
+    def remove_slot(self, slot: int) -> int:
+        song_idx = self.slots[slot]
+        r = self.song_ranges[song_idx]
+        self.total_error, self.total_actual = self.delta(song_idx, None)
+        self.actual[r] -= self.durations[song_idx]
+        self.slots[slot] = self.slots[-1]
+        self.slots.pop()
+
+        if not self.allow_duplicates:
+            self.unused[r].add(song_idx)
+
+        return song_idx
+
+    def pick_unused(self, rng: random.Random) -> int | None:
+        """Pick a candidate song, preferring ranges which are still short of their target."""
+        short = [r for r, pool in enumerate(self.unused) if pool and self.actual[r] < self.required[r]]
+        candidates = short or [r for r, pool in enumerate(self.unused) if pool]
+
+        if not candidates:
+            return None
+
+        return self.unused[rng.choice(candidates)].choice(rng)
+
+
+class PlaylistOptimizer:
+    """Generates playlists which follow a tempo progression, using simulated annealing."""
+
+    FITNESS_DISTRIBUTION_WEIGHT = 0.7
+    FITNESS_DURATION_WEIGHT = 0.3
+    GREEDY_UPPER_TOLERANCE = 1.1
+    GREEDY_LOWER_TOLERANCE = 0.9
+
+    def __init__(self, settings: TempoPlaylistSettings, tempo_step: int = 5):
+        self.settings = settings
+        self.total_duration = float(settings.duration)
+        self.tempo_step = tempo_step
+        self.tempo_ranges = list(calculate_tempo_schedule(
+            duration=self.total_duration,
+            min_tempo=settings.min_tempo,
+            max_tempo=settings.max_tempo,
+            easing_function=settings.easing_function,
+            tempo_step=tempo_step,
+        ))
+
+        # The minimum tempo of each range is inherently sorted, perfect for a binary search.
+        self._range_min_tempos = [r.min_tempo for r in self.tempo_ranges]
+
+    def get_range_index(self, tempo: int) -> int | None:
+        """Find the index of the TempoRange a tempo falls into."""
+        if not self.settings.min_tempo <= tempo < self.settings.max_tempo:
+            return None
+
+        return bisect.bisect_right(self._range_min_tempos, tempo) - 1
+
+    def fitness(self, total_error: float, total_actual: float) -> float:
+        """Score a playlist from its total distribution error and its total duration."""
+        if self.total_duration <= 0 or total_actual <= 0:
+            return 0.0
+
+        # How well the duration of each tempo range was met.
+        distribution_fitness = 1.0 - (total_error / self.total_duration)
+
+        # How close the total playlist duration is to the target.
+        duration_fitness = 1.0 - abs(self.total_duration - total_actual) / self.total_duration
+
+        return (
+            distribution_fitness * self.FITNESS_DISTRIBUTION_WEIGHT
+            + duration_fitness * self.FITNESS_DURATION_WEIGHT
+        )
+
+    def calculate_distribution(self, playlist: Sequence[Song]) -> dict[TempoRange, TempoDistribution]:
+        """Calculate the tempo distribution for a given playlist."""
+        songs_by_range: list[list[Song]] = [[] for _ in self.tempo_ranges]
+
+        for song in playlist:
+            if (r := self.get_range_index(song.tempo)) is not None:
+                songs_by_range[r].append(song)
+
+        distribution: dict[TempoRange, TempoDistribution] = {}
+
+        for tempo_range, songs in zip(self.tempo_ranges, songs_by_range):
+            actual_duration = sum(song.duration for song in songs)
+            distribution[tempo_range] = TempoDistribution(
+                required_duration=tempo_range.required_duration,
+                actual_duration=actual_duration,
+                song_count=len(songs),
+                deficit=tempo_range.required_duration - actual_duration,
+                songs=songs,
+            )
+
+        return distribution
+
+    def _greedy_selection(self, state: _PlaylistState) -> None:
+        """Fill each tempo range with its longest songs, to within tolerance of its target."""
+        for r, tempo_range in enumerate(self.tempo_ranges):
+            target = tempo_range.required_duration
+            candidates = sorted(state.unused[r].items, key=state.durations.__getitem__, reverse=True)
+
+            for song_idx in candidates:
+                if state.actual[r] + state.durations[song_idx] <= target * self.GREEDY_UPPER_TOLERANCE:
+                    state.add(song_idx)
+
+                if state.actual[r] >= target * self.GREEDY_LOWER_TOLERANCE:
+                    break
+
+    def _greedy_index_selection(self, state: _PlaylistState, index: TempoIndex, positions: dict[SpotifyIDT, int]) -> None:
+        """Greedy fill, asking the index for the longest song which still fits each range."""
+        # Used songs are discarded from a working copy, so every query stays a binary search.
+        unused = index.copy()
+
+        for r, tempo_range in enumerate(self.tempo_ranges):
+            target = tempo_range.required_duration
+
+            while state.actual[r] < target * self.GREEDY_LOWER_TOLERANCE:
+                remaining = target * self.GREEDY_UPPER_TOLERANCE - state.actual[r]
+
+                if (song := unused.best_fit(remaining, tempo_range.min_tempo, tempo_range.max_tempo)) is None:
+                    break
+
+                unused.discard(song.track_id)
+                state.add(positions[song.track_id])
+
+    def _subset_sum_selection(self, state: _PlaylistState, rng: random.Random) -> None:
+        """
+        Fill each tempo range with the subset of its songs whose total is closest to its target.
+
+        Durations are counted in tenths of a minute and the sums reachable from each range's
+        songs are tracked in a boolean array, shifted by each song's duration in turn. Only
+        sums up to one longest song past the target matter, and a duration never needs more
+        copies than fit in that span, so the work is bounded by the target rather than by
+        the library size.
+        """
+        # How far the ranges filled so far run over (or under) their combined target.
+        carry = 0
+
+        for r, tempo_range in enumerate(self.tempo_ranges):
+            target = int(round(tempo_range.required_duration / _DURATION_QUANTUM))
+
+            if not (candidates := list(state.unused[r].items)):
+                carry -= target
+                continue
+
+            # Visit songs in a random order, so each seed starts from a different playlist.
+            rng.shuffle(candidates)
+            weights = np.maximum(np.rint(np.array([state.durations[idx] for idx in candidates]) / _DURATION_QUANTUM), 1).astype(np.int64)
+            capacity = target + int(weights.max())
+
+            # 1. KEEP ONLY AS MANY SONGS OF EACH DURATION AS COULD EVER FIT.
+            order = np.argsort(weights, kind="stable")
+            sorted_weights = weights[order]
+            starts = np.searchsorted(sorted_weights, sorted_weights, side="left")
+            keep = order[(np.arange(len(order)) - starts) < capacity // sorted_weights]
+            keep.sort()
+
+            # 2. TRACK WHICH SUMS ARE REACHABLE, AND THE FIRST SONG WHICH REACHED EACH ONE.
+            reachable = np.zeros(capacity + 1, dtype=bool)
+            reachable[0] = True
+            reached_by = np.full(capacity + 1, -1, dtype=np.int64)
+
+            for idx in keep.tolist():
+                w = int(weights[idx])
+                newly = reachable[:-w] & ~reachable[w:]
+                reached_by[w:][newly] = idx
+                reachable[w:] |= newly
+
+                if reachable[target]:
+                    break
+
+            # 3. TAKE THE REACHABLE SUM WHICH SCORES BEST, WEIGHING THIS RANGE'S ERROR AGAINST THE RUNNING TOTAL.
+            sums = np.flatnonzero(reachable)
+            cost = (
+                self.FITNESS_DISTRIBUTION_WEIGHT * np.abs(sums - target)
+                + self.FITNESS_DURATION_WEIGHT * np.abs(carry + sums - target)
+            )
+            total = int(sums[np.argmin(cost)])
+            carry += total - target
+
+            # 4. WALK BACK THROUGH THE SONGS WHICH MADE UP THAT SUM.
+            while total > 0:
+                idx = int(reached_by[total])
+                state.add(candidates[idx])
+                total -= int(weights[idx])
+
+    def generate_playlist(
+        self,
+        song_library: Sequence[Song] | SongLibrary | TempoIndex,
+        max_iterations: int = 2000,
+        allow_duplicates: bool = False,
+        shuffle_within_ranges: bool = True,
+        initial_temperature: float = 1.0,
+        cooling_rate: float = 0.995,
+        seed: int | None = None,
+        initial_selection: InitialSelectionT = "subset_sum",
+        patience: int | None = None,
+        target_fitness: float | None = None,
+        cancel_event: threading.Event | None = None,
+    ) -> PlaylistResult:
+        """
+        Generate an optimized playlist using simulated annealing.
+
+        Annealing starts from a subset-sum fill of each tempo range, which is usually close
+        to optimal already, so a few hundred iterations are often enough. Pass
+        initial_selection="greedy" to start from the longest songs instead.
+
+        The chain stops early once its best fitness reaches .target_fitness, once .patience
+        iterations pass without improving on it, or once .cancel_event is set.
+
+        Pass a TempoIndex to reuse one grouping of the songs by tempo across many calls,
+        a plain sequence of Songs is indexed on every call.
+        """
+        if not song_library:
+            raise ValueError("Song library cannot be empty")
+
+        rng = random.Random(seed)
+        start = time.perf_counter()
+
+        # Songs outside of the tempo progression can never contribute, so drop them once.
+        if isinstance(song_library, SongLibrary):
+            rows = song_library.filter(min_tempo=self.settings.min_tempo, max_tempo=self.settings.max_tempo)
+            range_idx = np.searchsorted(self._range_min_tempos, song_library.tempos[rows], side="right") - 1
+            song_ranges = range_idx.tolist()
+            durations = song_library.durations[rows].tolist()
+
+            def materialize(song_idx: int) -> Song:
+                return song_library.song_at(int(rows[song_idx]))
+
+            index = None
+
+        else:
+            index = song_library if isinstance(song_library, TempoIndex) else TempoIndex(song_library)
+            songs: list[Song] = []
+            song_ranges: list[int] = []
+
+            # The index already holds the songs in tempo order, each range is a contiguous run.
+            for r, tempo_range in enumerate(self.tempo_ranges):
+                for song in index.songs_in_range(tempo_range.min_tempo, tempo_range.max_tempo):
+                    songs.append(song)
+                    song_ranges.append(r)
+
+            durations = [song.duration for song in songs]
+            materialize = songs.__getitem__
+
+        state = _PlaylistState(self, durations, song_ranges, allow_duplicates)
+
+        # 1. Generate a good starting point.
+        if initial_selection == "subset_sum":
+            self._subset_sum_selection(state, rng)
+        elif index is not None:
+            self._greedy_index_selection(state, index, {song.track_id: idx for idx, song in enumerate(songs)})
+        else:
+            self._greedy_selection(state)
+        current_score = state.fitness()
+        best_slots, best_score = list(state.slots), current_score
+        initial_score, last_improvement = current_score, 0
+        temperature = initial_temperature
+        stopped: StopReasonT = "max_iterations"
+        iteration = 0
+
+        for iteration in range(max_iterations):
+            if target_fitness is not None and best_score >= target_fitness:
+                stopped = "target"
+                break
+
+            if patience is not None and iteration - last_improvement >= patience:
+                stopped = "plateau"
+                break
+
+            # Checking an Event shared across processes costs a syscall, so only do it now and then.
+            if cancel_event is not None and iteration % 256 == 0 and cancel_event.is_set():
+                stopped = "cancelled"
+                break
+
+            # 2. Propose a neighbor, scoring it from the per-range sums alone.
+            move = rng.choice(("add", "remove", "swap"))
+            removed_slot = added = None
+
+            if move != "add" and state.slots:
+                removed_slot = rng.randrange(len(state.slots))
+
+            if move != "remove":
+                added = state.pick_unused(rng)
+
+            if (removed_slot is None and added is None) or (move == "remove" and len(state.slots) <= 1):
+                temperature *= cooling_rate
+                continue
+
+            removed = None if removed_slot is None else state.slots[removed_slot]
+            candidate_score = state.fitness(*state.delta(removed, added))
+
+            # 3. Always move to a better neighbor, and sometimes to a worse one.
+            delta = candidate_score - current_score
+
+            if delta > 0 or (temperature > 0 and rng.random() < math.exp(delta / temperature)):
+                if removed_slot is not None:
+                    state.remove_slot(removed_slot)
+                if added is not None:
+                    state.add(added)
+
+                current_score = candidate_score
+
+                if current_score > best_score:
+                    best_slots, best_score = list(state.slots), current_score
+                    last_improvement = iteration
+
+            # 4. Cool the temperature.
+            temperature *= cooling_rate
+
+        # 5. Finalize the playlist in tempo order.
+        slots_by_range: list[list[int]] = [[] for _ in self.tempo_ranges]
+
+        for song_idx in best_slots:
+            slots_by_range[song_ranges[song_idx]].append(song_idx)
+
+        playlist: list[Song] = []
+
+        for range_slots in slots_by_range:
+            if shuffle_within_ranges:
+                rng.shuffle(range_slots)
+
+            playlist.extend(materialize(song_idx) for song_idx in range_slots)
+
+        return PlaylistResult(
+            songs=playlist,
+            total_duration=sum(song.duration for song in playlist),
+            target_duration=self.total_duration,
+            tempo_distribution=self.calculate_distribution(playlist),
+            fitness_score=best_score,
+            chains=[
+                ChainStats(
+                    seed=seed,
+                    iterations=iteration + 1 if stopped == "max_iterations" else iteration,
+                    initial_fitness=initial_score,
+                    best_fitness=best_score,
+                    stopped=stopped,
+                    seconds=time.perf_counter() - start,
+                ),
+            ],
+        )
+
+    def generate_playlist_parallel(
+        self,
+        song_library: Sequence[Song] | SongLibrary | TempoIndex,
+        chains: int | None = None,
+        max_workers: int | None = None,
+        seed: int | None = None,
+        max_iterations: int = 20_000,
+        patience: int | None = 2_000,
+        target_fitness: float | None = None,
+        **options: Any,
+    ) -> PlaylistResult:
+        """
+        Run independent annealing chains from different seeds, keeping the best playlist.
+
+        Chains run across a process pool, each stopping on its own once it plateaus. As soon
+        as any chain reaches .target_fitness, the chains still running are cancelled and
+        those not yet started are skipped. With a single worker the chains run in this
+        process, one after another.
+        """
+        chains = chains or os.cpu_count() or 1
+        max_workers = min(chains, max_workers or os.cpu_count() or 1)
+        seeds = [random.Random(seed).getrandbits(32) + idx for idx in range(chains)]
+        options = {"max_iterations": max_iterations, "patience": patience, "target_fitness": target_fitness, **options}
+        results: list[PlaylistResult] = []
+
+        # Index the songs once, rather than once per chain.
+        if not isinstance(song_library, SongLibrary | TempoIndex):
+            song_library = TempoIndex(song_library)
+
+        if max_workers == 1:
+            for chain_seed in seeds:
+                results.append(self.generate_playlist(song_library, seed=chain_seed, **options))
+
+                if target_fitness is not None and results[-1].fitness_score >= target_fitness:
+                    break
+
+        else:
+            context = multiprocessing.get_context()
+            cancel_event = context.Event()
+
+            # Ship the library to each worker once, rather than with every chain.
+            with futures.ProcessPoolExecutor(
+                max_workers,
+                mp_context=context,
+                initializer=_init_chain_worker,
+                initargs=(self, song_library, cancel_event),
+            ) as pool:
+                pending = [pool.submit(_run_chain, chain_seed, options) for chain_seed in seeds]
+
+                for future in futures.as_completed(pending):
+                    if future.cancelled():
+                        continue
+
+                    results.append(result := future.result())
+
+                    if target_fitness is not None and result.fitness_score >= target_fitness:
+                        cancel_event.set()
+
+                        for other in pending:
+                            other.cancel()
+
+        best = max(results, key=lambda result: result.fitness_score)
+        best.chains = sorted((stats for result in results for stats in result.chains), key=lambda stats: seeds.index(stats.seed))
+
+        logger.debug(
+            f"Ran {len(best.chains)}/{chains} chains, best fitness {best.fitness_score:.4f} "
+            f"after {sum(stats.iterations for stats in best.chains)} total iterations"
+        )
+
+        return best
+
+
+_CHAIN_WORKER: dict[str, Any] = {}
+
+
+def _init_chain_worker(optimizer: PlaylistOptimizer, song_library: SongLibrary | TempoIndex, cancel_event: threading.Event) -> None:
+    """Hold a chain's inputs for the lifetime of a pool worker."""
+    _CHAIN_WORKER.update(optimizer=optimizer, song_library=song_library, cancel_event=cancel_event)
+
+
+def _run_chain(seed: int, options: dict[str, Any]) -> PlaylistResult:
+    """Run a single annealing chain in a pool worker."""
+    optimizer: PlaylistOptimizer = _CHAIN_WORKER["optimizer"]
+    return optimizer.generate_playlist(_CHAIN_WORKER["song_library"], seed=seed, cancel_event=_CHAIN_WORKER["cancel_event"], **options)
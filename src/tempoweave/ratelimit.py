@@ -0,0 +1,56 @@
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """A token bucket shared across threads, refilling at .rate tokens per second."""
+
+    def __init__(self, rate: float, capacity: float | None = None):
+        if rate <= 0:
+            raise ValueError(f"rate must be positive, got {rate}")
+
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1.0)
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    def acquire(self, tokens: float = 1.0) -> float:
+        """Take tokens from the bucket, blocking until they're available. Returns the seconds waited."""
+        waited = 0.0
+
+        while True:
+            with self._lock:
+                now = time.monotonic()
+
+                if now >= self._blocked_until:
+                    self._refill(now)
+
+                    if self._tokens >= tokens:
+                        self._tokens -= tokens
+                        return waited
+
+                    delay = (tokens - self._tokens) / self.rate
+                else:
+                    delay = self._blocked_until - now
+
+            time.sleep(delay)
+            waited += delay
+
+    def pause(self, seconds: float) -> None:
+        """Hold every caller for .seconds, then resume from an empty bucket."""
+        with self._lock:
+            resume_at = time.monotonic() + seconds
+
+            if resume_at > self._blocked_until:
+                self._blocked_until = resume_at
+                self._tokens = 0.0
+                self._updated_at = resume_at
@@ -0,0 +1,111 @@
+from collections.abc import Callable
+
+import dataclasses
+import functools as ft
+import itertools as it
+import logging
+
+from tempoplay.types import EasingFunctionT
+
+logger = logging.getLogger(__name__)
+
+
+# --- Easing functions map normalized tempo progress [0, 1] onto the share of the
+# --- playlist's duration spent up to that tempo. A schedule has only a few dozen ranges,
+# --- so plain floats are plenty; keeping numpy out lets the CLI print one instantly.
+
+def linear(t: float) -> float:
+    """Linear easing: constant rate of change."""
+    return t
+
+
+def ease_in(t: float) -> float:
+    """Ease in: slow start, accelerating. (t^2)"""
+    return t * t
+
+
+def ease_out(t: float) -> float:
+    """Ease out: fast start, decelerating. (1 - (1-t)^2)"""
+    return 1 - (1 - t) * (1 - t)
+
+
+def ease_in_out(t: float) -> float:
+    """Ease in-out: slow start and end, fast middle."""
+    return 2 * t * t if t < 0.5 else 1 - 2 * (1 - t) * (1 - t)
+
+
+def ease_in_cubic(t: float) -> float:
+    """Cubic ease in: slower start, sharper acceleration. (t^3)"""
+    return t ** 3
+
+
+def ease_out_cubic(t: float) -> float:
+    """Cubic ease out: faster start, longer deceleration. (1 - (1-t)^3)"""
+    return 1 - (1 - t) ** 3
+
+
+def ease_in_out_cubic(t: float) -> float:
+    """Cubic ease in-out: slow start and end, very fast middle."""
+    return 4 * t ** 3 if t < 0.5 else 1 - 4 * (1 - t) ** 3
+
+
+def step(t: float) -> float:
+    """Step: hold every tempo range for an equal share, then jump to the next. (t, over ranges rather than BPM)"""
+    return t
+
+
+EASING_FUNCTIONS: dict[EasingFunctionT, Callable[[float], float]] = {
+    "linear": linear,
+    "ease_in": ease_in,
+    "ease_out": ease_out,
+    "ease_in_out": ease_in_out,
+    "ease_in_cubic": ease_in_cubic,
+    "ease_out_cubic": ease_out_cubic,
+    "ease_in_out_cubic": ease_in_out_cubic,
+    "step": step,
+}
+
+
+@dataclasses.dataclass(frozen=True)
+class TempoRange:
+    """Represents a slice of the tempo progression and how long it should play for."""
+
+    min_tempo: int
+    max_tempo: int
+    required_duration: float
+
+
+@ft.cache
+def calculate_tempo_schedule(
+    duration: float,
+    min_tempo: int,
+    max_tempo: int,
+    easing_function: EasingFunctionT = "linear",
+    tempo_step: int = 5,
+) -> tuple[TempoRange, ...]:
+    """
+    Split [min_tempo, max_tempo) into ranges of .tempo_step BPM, and assign each one its duration.
+
+    The schedule only depends on its arguments, so it's computed once and shared by every
+    playlist with the same settings.
+    """
+    if min_tempo >= max_tempo:
+        raise ValueError(f"min_tempo ({min_tempo}) must be less than max_tempo ({max_tempo})")
+
+    boundaries = [*range(min_tempo, max_tempo, tempo_step), max_tempo]
+
+    if easing_function == "step":
+        # Each range is a plateau of its own, so progress is counted in ranges rather than BPM.
+        progress = [idx / (len(boundaries) - 1) for idx in range(len(boundaries))]
+    else:
+        progress = [(boundary - min_tempo) / (max_tempo - min_tempo) for boundary in boundaries]
+
+    # The difference in the eased value determines the duration proportion. The input is
+    # normalized to [0, 1], so the weights across all ranges sum to 1.
+    eased = [EASING_FUNCTIONS[easing_function](t) for t in progress]
+    weights = [hi - lo for lo, hi in it.pairwise(eased)]
+
+    return tuple(
+        TempoRange(min_tempo=lo, max_tempo=hi, required_duration=duration * weight)
+        for lo, hi, weight in zip(boundaries[:-1], boundaries[1:], weights)
+    )
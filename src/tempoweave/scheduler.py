@@ -0,0 +1,171 @@
+from collections.abc import Iterable, Sequence
+from typing import Any
+
+from concurrent import futures
+import dataclasses
+import logging
+import os
+import time
+
+from tempoplay.const import SPOTIFY_MAX_PLAYLIST_ITEMS_PER_REQUEST
+from tempoplay.fetch import SongFetcher
+from tempoplay.metrics import metrics
+from tempoplay.optimizer import PlaylistOptimizer, PlaylistResult
+from tempoplay.schema import Song, TempoPlaylistSettings
+from tempoplay.types import SpotifyIDT, SpotifyURIT, SpotifyURLT
+
+logger = logging.getLogger(__name__)
+
+
+@dataclasses.dataclass(frozen=True)
+class PlaylistJob:
+    """Represents a tempo playlist to regenerate."""
+
+    playlist_id: SpotifyIDT
+    """The playlist to regenerate. Its description holds the TempoPlaylistSettings."""
+
+    seed_playlists: tuple[SpotifyIDT, ...] = ()
+    """Playlists to draw songs from. Defaults to the playlist itself."""
+
+    @property
+    def sources(self) -> tuple[SpotifyIDT, ...]:
+        return self.seed_playlists or (self.playlist_id,)
+
+
+@dataclasses.dataclass
+class PlaylistJobReport:
+    """Represents the outcome of regenerating a single playlist."""
+
+    playlist_id: SpotifyIDT
+    result: PlaylistResult | None = None
+    error: str | None = None
+    timings: dict[str, float] = dataclasses.field(default_factory=dict)
+    """Seconds spent in each stage of the job."""
+
+
+def _optimize(settings: TempoPlaylistSettings, songs: Sequence[Song], options: dict[str, Any]) -> tuple[PlaylistResult, float]:
+    """Run the optimizer for a single playlist, in a worker process."""
+    start = time.perf_counter()
+    result = PlaylistOptimizer(settings).generate_playlist(songs, **options)
+    return result, time.perf_counter() - start
+
+
+class BatchScheduler:
+    """
+    Regenerates many tempo playlists in a single bounded run.
+
+    Every seed playlist and song is fetched at most once, however many playlists share
+    it, and the optimizations then run in parallel across processes. Every request goes
+    through the SongFetcher, so build it with a rate_limiter (the CLI's --rate) to keep
+    the whole run within a Spotify rate budget.
+    """
+
+    def __init__(self, song_fetcher: SongFetcher, optimize_workers: int | None = None, **optimizer_options: Any):
+        self.song_fetcher = song_fetcher
+        self.optimize_workers = optimize_workers or os.cpu_count() or 1
+        self.optimizer_options = optimizer_options
+
+    def run(
+        self,
+        jobs: Iterable[PlaylistJob | SpotifyURIT | SpotifyURLT | SpotifyIDT],
+        publish: bool = False,
+        **pipeline_options: Any,
+    ) -> list[PlaylistJobReport]:
+        """Regenerate every playlist, optionally replacing their contents on Spotify."""
+        jobs = [
+            job if isinstance(job, PlaylistJob) else PlaylistJob(self.song_fetcher.get_spotify_id(job))
+            for job in jobs
+        ]
+        reports = {job.playlist_id: PlaylistJobReport(job.playlist_id) for job in jobs}
+        settings: dict[SpotifyIDT, TempoPlaylistSettings] = {}
+
+        # 1. READ EACH PLAYLIST'S SETTINGS FROM ITS DESCRIPTION.
+        for job in jobs:
+            report = reports[job.playlist_id]
+            start = time.perf_counter()
+
+            try:
+                info = self.song_fetcher.spotify.playlist(job.playlist_id, fields="id,description")
+                settings[job.playlist_id] = TempoPlaylistSettings.model_validate(info["description"])
+            except Exception as e:
+                logger.warning(f"Skipping playlist '{job.playlist_id}': {e}")
+                report.error = str(e)
+
+            report.timings["settings"] = time.perf_counter() - start
+
+        jobs = [job for job in jobs if job.playlist_id in settings]
+
+        # 2. FETCH EVERY SEED PLAYLIST AND SONG ONCE, NO MATTER HOW MANY JOBS SHARE THEM.
+        start = time.perf_counter()
+        seed_tracks: dict[SpotifyIDT, list[SpotifyIDT]] = {}
+
+        for seed in dict.fromkeys(seed for job in jobs for seed in job.sources):
+            try:
+                seed_tracks[seed] = list(self.song_fetcher.iter_playlist_track_ids(seed))
+            except Exception as e:
+                logger.warning(f"Could not read seed playlist '{seed}': {e}")
+                seed_tracks[seed] = []
+
+        track_ids = list(dict.fromkeys(track_id for tracks in seed_tracks.values() for track_id in tracks))
+        library = {song.track_id: song for song in self.song_fetcher.stream_songs(track_ids, **pipeline_options)}
+        fetch_elapsed = time.perf_counter() - start
+
+        logger.info(f"Fetched {len(library)} unique songs for {len(jobs)} playlists in {fetch_elapsed:.1f}s")
+
+        # 3. OPTIMIZE EVERY PLAYLIST IN PARALLEL.
+        with futures.ProcessPoolExecutor(self.optimize_workers) as pool:
+            pending: dict[futures.Future, PlaylistJob] = {}
+
+            for job in jobs:
+                reports[job.playlist_id].timings["fetch"] = fetch_elapsed
+                ids = dict.fromkeys(track_id for seed in job.sources for track_id in seed_tracks[seed])
+                songs = [library[track_id] for track_id in ids if track_id in library]
+
+                if not songs:
+                    reports[job.playlist_id].error = "No songs available to build the playlist from"
+                    continue
+
+                future = pool.submit(_optimize, settings[job.playlist_id], songs, self.optimizer_options)
+                pending[future] = job
+
+            for future in futures.as_completed(pending):
+                job = pending[future]
+                report = reports[job.playlist_id]
+
+                try:
+                    report.result, report.timings["optimize"] = future.result()
+                except Exception as e:
+                    logger.exception(f"Failed to optimize playlist '{job.playlist_id}': {e}")
+                    report.error = str(e)
+                    continue
+
+                # 4. WRITE THE NEW PLAYLIST BACK.
+                if publish:
+                    start = time.perf_counter()
+
+                    try:
+                        self.publish(job.playlist_id, report.result.songs)
+                    except Exception as e:
+                        logger.exception(f"Failed to publish playlist '{job.playlist_id}': {e}")
+                        report.error = str(e)
+
+                    report.timings["publish"] = time.perf_counter() - start
+
+        for report in reports.values():
+            timings = ", ".join(f"{stage}={seconds:.2f}s" for stage, seconds in report.timings.items())
+            status = "failed" if report.error else "done"
+            logger.info(f"Playlist '{report.playlist_id}' {status} ({timings})")
+
+        if metrics.enabled:
+            metrics.log_summary()
+
+        return list(reports.values())
+
+    def publish(self, playlist_id: SpotifyIDT, songs: Sequence[Song]) -> None:
+        """Replace the contents of a playlist with the given songs."""
+        uris = [song.spotify_uri for song in songs]
+        head, tail = uris[:SPOTIFY_MAX_PLAYLIST_ITEMS_PER_REQUEST], uris[SPOTIFY_MAX_PLAYLIST_ITEMS_PER_REQUEST:]
+        self.song_fetcher.spotify.playlist_replace_items(playlist_id, head)
+
+        for idx in range(0, len(tail), SPOTIFY_MAX_PLAYLIST_ITEMS_PER_REQUEST):
+            self.song_fetcher.spotify.playlist_add_items(playlist_id, tail[idx: idx + SPOTIFY_MAX_PLAYLIST_ITEMS_PER_REQUEST])
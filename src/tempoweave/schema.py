@@ -1,10 +1,11 @@
-from typing import Any, Literal
+from collections.abc import Iterable
+from typing import Any, Self
 import datetime as dt
 import math
 
 import pydantic
 
-from tempoplay.types import SpotifyIDT
+from tempoplay.types import EasingFunctionT, SpotifyIDT
 
 
 class SpotifyAuthInfo(pydantic.BaseModel):
@@ -67,6 +68,23 @@ class Song(pydantic.BaseModel):
         """Spotify URI of the song."""
         return f"spotify:track:{self.track_id}"
 
+    @classmethod
+    def from_trusted_rows(cls, rows: Iterable[dict[str, Any]]) -> list[Self]:
+        """
+        Build Songs from rows which were already validated, such as our own caches.
+
+        Validation is skipped entirely, so the rows must hold exactly what a validated
+        Song would: tempo already floored to 5 BPM and duration already rounded.
+        """
+        fields_set = set(cls.model_fields)
+        return [cls.model_construct(fields_set, **row) for row in rows]
+
+    @staticmethod
+    def to_rows(songs: Iterable["Song"]) -> list[dict[str, Any]]:
+        """Dump Songs to plain rows, the inverse of .from_trusted_rows()."""
+        # Copying the field values skips pydantic's serializer and the computed fields.
+        return [song.__dict__.copy() for song in songs]
+
 
 class TempoPlaylistSettings(pydantic.BaseModel):
     """Represents the type of tempo playlist to build."""
@@ -80,7 +98,7 @@ class TempoPlaylistSettings(pydantic.BaseModel):
     max_tempo: pydantic.PositiveInt
     """The maximum boundary for tempo in this playlist."""
 
-    easing_function: Literal["linear"] = "linear"
+    easing_function: EasingFunctionT = "linear"
     """The progression of tempo throughout the playlist."""
 
     @pydantic.model_validator(mode="before")
@@ -130,6 +148,14 @@ class TempoPlaylistSettings(pydantic.BaseModel):
 
         return v
 
+    @pydantic.field_validator("easing_function", mode="before")
+    @classmethod
+    def validate_normalize_easing_function_name(cls, v: str) -> str:
+        if not isinstance(v, str):
+            return v
+
+        return v.lower().replace("-", "_")
+
     @pydantic.field_validator("max_tempo")
     @classmethod
     def validate_max_is_greater_than_min(cls, v: int, info: pydantic.ValidationInfo) -> int:
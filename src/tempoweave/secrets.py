@@ -1,21 +1,76 @@
-from typing import cast
+from typing import Any, cast
+
+import datetime as dt
+import logging
+import threading
+import time
 
-from cryptography.fernet import Fernet
 from spotipy.cache_handler import MemoryCacheHandler
-from sqlalchemy.orm import Session
 import sqlalchemy as sa
 
 from tempoplay.types import SpotifyAuthInfoT
 from tempoplay.schema import SpotifyAuthInfo
 
+logger = logging.getLogger(__name__)
 
-class GitHubActionsCacheHandler(MemoryCacheHandler):
-    """Store the token in memory and in GitHub secret store."""
 
-    def __init__(self, secret_key: str, db_engine: sa.engine.Engine):
+class GitHubActionsCacheHandler(MemoryCacheHandler):
+    """
+    Store the token in memory and, encrypted, in a database shared by every worker.
+
+    Reads are served from memory until the token is within .refresh_margin seconds of
+    expiring; only then is the database read and the token decrypted. Refreshes happen
+    exactly once across all workers: the first worker to find the token expiring claims
+    a lease on its row with a compare-and-swap and hands the token back as expired, so
+    the auth manager refreshes it and calls .save_token_to_cache(). Every other worker
+    waits for the new version of the row to appear. A lease which is never released
+    (say, the worker died) lapses after .lease_seconds.
+    """
+
+    def __init__(
+        self,
+        secret_key: str,
+        db_engine: sa.engine.Engine,
+        refresh_margin: float = 60.0,
+        lease_seconds: float = 30.0,
+        poll_interval: float = 0.25,
+        token_name: str = "spotify",
+    ):
         self.db_engine = db_engine
         self.token_info: SpotifyAuthInfo | None = None
+        self.refresh_margin = refresh_margin
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self.token_name = token_name
+
+        from cryptography.fernet import Fernet  # only needed once a handler is built (spotipy may load it anyway, through redis).
+
         self._cipher = Fernet(key=secret_key.encode())
+        self._public: SpotifyAuthInfoT | None = None
+        self._lock = threading.Lock()
+
+        self.metadata = sa.MetaData()
+        self.table = sa.Table(
+            "auth_tokens",
+            self.metadata,
+            sa.Column("name", sa.String, primary_key=True),
+            sa.Column("access_token", sa.String, nullable=False),
+            sa.Column("refresh_token", sa.String, nullable=True),
+            sa.Column("token_type", sa.String, nullable=False),
+            sa.Column("scope", sa.String, nullable=False),
+            sa.Column("expires_in", sa.Integer, nullable=False),
+            sa.Column("expires_at", sa.Integer, nullable=False),
+            sa.Column("version", sa.Integer, nullable=False),
+            sa.Column("lease_until", sa.Float, nullable=True),
+            sa.Column("updated_at", sa.DateTime, nullable=False),
+        )
+        self.metadata.create_all(self.db_engine)
+
+    @classmethod
+    def from_url(cls, secret_key: str, db_url: str, **options: Any) -> "GitHubActionsCacheHandler":
+        """Connect through a pooled engine which checks connections before handing them out."""
+        db_engine = sa.create_engine(db_url, pool_pre_ping=True)
+        return cls(secret_key, db_engine, **options)
 
     def _public_token_info(self) -> SpotifyAuthInfoT:
         """Create a clear-text version of .token_info."""
@@ -28,36 +83,108 @@ class GitHubActionsCacheHandler(MemoryCacheHandler):
 
         return token_info
 
-    # def get_cached_token(self) -> SpotifyAuthInfoT | None:
-    #     """Fetch the token from memory, falling back to secret store."""
-    #     if self.token_info is not None:
-    #         return self._public_token_info()
-
-    #     with Session(bind=self.db_engine) as sess:
-    #         q = """SELECT * FROM auth_tokens ORDER BY expires_at DESC LIMIT 1"""
-
-    #         if not (r := sess.execute(sa.text(q))):
-    #             return None
-
-    #     d = r.scalar().asdict()
-    #     d["access_token"] = self._cipher.decrypt(d.access_token)
-    #     d["refresh_token"] = self._cipher.decrypt(d.refresh_token)
-
-    #     self.token_info = SpotifyAuthInfo.model_validate(r)
-
-    #     return self._public_token_info()
-
-    # def save_token_to_cache(self, token: SpotifyAuthInfoT) -> None:
-    #     """Store the token in memory and secret store."""
-    #     self.token_info = SpotifyAuthInfo.model_validate(token)
-
-    #     if extras := self.token_info.__pydantic_extra__:
-    #         logger.warning(f"Extra data found on token: {extras}")
-
-    #     d = self._public_token_info()
-    #     d["access_token"] = self._cipher.encrypt(d["access_token"]).decode()
-    #     d["refresh_token"] = self._cipher.encrypt(d["refresh_token"]).decode()
-
-    #     with Session(bind=self.db_engine) as sess:
-    #         q = """INSERT INTO auth_tokens"""
-    #         r = sess.execute(sa.text(q))
+    def _remember(self, token: SpotifyAuthInfoT | dict[str, Any]) -> SpotifyAuthInfoT:
+        """Hold a token in memory, already in the clear-text form that spotipy reads."""
+        self.token_info = SpotifyAuthInfo.model_validate(token)
+        self._public = self._public_token_info()
+        return self._public
+
+    def _is_expiring(self, token: SpotifyAuthInfoT) -> bool:
+        return token["expires_at"] - self.refresh_margin <= time.time()
+
+    # DATABASE ACCESS.
+
+    def _read(self) -> sa.Row | None:
+        q = sa.select(self.table).where(self.table.c.name == self.token_name)
+
+        with self.db_engine.connect() as conn:
+            return conn.execute(q).first()
+
+    def _decrypt(self, row: sa.Row) -> dict[str, Any]:
+        return {
+            "access_token": self._cipher.decrypt(row.access_token.encode()).decode(),
+            "refresh_token": None if row.refresh_token is None else self._cipher.decrypt(row.refresh_token.encode()).decode(),
+            "token_type": row.token_type,
+            "scope": row.scope,
+            "expires_in": row.expires_in,
+            "expires_at": row.expires_at,
+        }
+
+    def _claim_refresh(self, row: sa.Row) -> bool:
+        """Take the refresh lease, unless the row changed or another worker holds it."""
+        now = time.time()
+        q = (
+            sa.update(self.table)
+            .where(self.table.c.name == self.token_name)
+            .where(self.table.c.version == row.version)
+            .where(sa.or_(self.table.c.lease_until.is_(None), self.table.c.lease_until < now))
+            .values(lease_until=now + self.lease_seconds)
+        )
+
+        with self.db_engine.begin() as conn:
+            return conn.execute(q).rowcount == 1
+
+    def _write(self, token: SpotifyAuthInfoT) -> None:
+        """Store the token, bumping its version and releasing any refresh lease."""
+        refresh_token = token.get("refresh_token")
+        values: dict[str, Any] = {
+            "access_token": self._cipher.encrypt(token["access_token"].encode()).decode(),
+            "refresh_token": None if refresh_token is None else self._cipher.encrypt(refresh_token.encode()).decode(),
+            "token_type": token["token_type"],
+            "scope": token["scope"],
+            "expires_in": token["expires_in"],
+            "expires_at": token["expires_at"],
+            "lease_until": None,
+            "updated_at": dt.datetime.now(tz=dt.UTC),
+        }
+
+        update = (
+            sa.update(self.table)
+            .where(self.table.c.name == self.token_name)
+            .values(**values, version=self.table.c.version + 1)
+        )
+
+        with self.db_engine.begin() as conn:
+            if conn.execute(update).rowcount == 1:
+                return
+
+            try:
+                with conn.begin_nested():
+                    conn.execute(sa.insert(self.table).values(**values, name=self.token_name, version=1))
+            except sa.exc.IntegrityError:
+                # Another worker stored the first token at the same time.
+                conn.execute(update)
+
+    # SPOTIPY CACHE HANDLER INTERFACE.
+
+    def get_cached_token(self) -> SpotifyAuthInfoT | None:
+        """Fetch the token from memory, falling back to the database when it's expiring."""
+        if (token := self._public) is not None and not self._is_expiring(token):
+            return token.copy()
+
+        with self._lock:
+            while True:
+                # Another thread may have refreshed the token while we waited on the lock.
+                if (token := self._public) is not None and not self._is_expiring(token):
+                    return token.copy()
+
+                if (row := self._read()) is None:
+                    return None
+
+                token = self._remember(self._decrypt(row))
+
+                if not self._is_expiring(token) or token.get("refresh_token") is None:
+                    return token.copy()
+
+                if self._claim_refresh(row):
+                    logger.info(f"Refreshing the '{self.token_name}' token, expires {dt.datetime.fromtimestamp(row.expires_at)}")
+
+                    # Report the token as expired, so the auth manager refreshes it now.
+                    return cast(SpotifyAuthInfoT, {**token, "expires_at": 0})
+
+                time.sleep(self.poll_interval)
+
+    def save_token_to_cache(self, token_info: SpotifyAuthInfoT) -> None:
+        """Store the token in memory and in the database."""
+        token = self._remember(token_info)
+        self._write(token)
@@ -0,0 +1,307 @@
+from collections.abc import Iterable, Iterator
+from typing import Any
+
+import json
+import logging
+import os
+import pathlib
+import threading
+
+import numpy as np
+
+from tempoplay.const import SNAPSHOT_FORMAT_VERSION
+from tempoplay.library import SongLibrary, Vocabulary
+from tempoplay.schema import Song
+from tempoplay.types import SpotifyIDT
+
+logger = logging.getLogger(__name__)
+
+_MANIFEST = "manifest.json"
+_FORMAT = "tempoweave.snapshot"
+
+# Fixed-width columns, one file each. Explicit byte order keeps snapshots portable.
+_COLUMNS: dict[str, np.dtype] = {
+    "track_ids": np.dtype("S22"),
+    "tempos": np.dtype("<i4"),
+    "durations": np.dtype("<f8"),
+    "artist_codes": np.dtype("<i4"),
+    "album_codes": np.dtype("<i4"),
+    "genre_codes": np.dtype("<i4"),
+    "title_ends": np.dtype("<i8"),
+}
+
+_VOCABULARIES = ("artists", "albums", "genres")
+
+
+class SongSnapshot:
+    """
+    A versioned, append-only, on-disk snapshot of an analyzed song library.
+
+    Each fixed-width field lives in its own raw column file which is memory-mapped on
+    read, so opening even a very large snapshot costs no parsing. Titles are packed into
+    a single UTF-8 blob addressed by end offsets, and artist, album and genre are stored
+    as codes into append-only vocabularies.
+
+    manifest.json records how many bytes of every file are committed. Appends write past
+    that point and then replace the manifest atomically, so readers never see a partial
+    append and a crashed append is truncated away by the next one. A track appended more
+    than once resolves to its latest row. There must only be one writer at a time, but
+    any number of threads may read while it appends.
+    """
+
+    def __init__(self, root: pathlib.Path | str):
+        self.root = pathlib.Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        # Reentrant, since append() reads the vocabularies while holding it.
+        self._lock = threading.RLock()
+        self._manifest = self._read_manifest()
+        self._columns: dict[str, np.ndarray] = {}
+        self._vocabularies: dict[str, Vocabulary] = {}
+        self._positions: dict[SpotifyIDT, int] | None = None
+        self._titles: np.ndarray | None = None
+
+    @classmethod
+    def from_songs(cls, root: pathlib.Path | str, songs: Iterable[Song]) -> "SongSnapshot":
+        """Write a snapshot of Songs, adding to any snapshot already at .root."""
+        snapshot = cls(root)
+        snapshot.append(songs)
+        return snapshot
+
+    def _read_manifest(self) -> dict[str, Any]:
+        path = self.root / _MANIFEST
+
+        if not path.exists():
+            return {"format": _FORMAT, "version": SNAPSHOT_FORMAT_VERSION, "rows": 0, "sizes": {}}
+
+        manifest = json.loads(path.read_text(encoding="utf-8"))
+
+        if manifest.get("format") != _FORMAT:
+            raise RuntimeError(f"'{self.root}' does not hold a song snapshot")
+
+        if manifest["version"] != SNAPSHOT_FORMAT_VERSION:
+            raise RuntimeError(f"Snapshot '{self.root}' is format version {manifest['version']}, expected {SNAPSHOT_FORMAT_VERSION}")
+
+        return manifest
+
+    def _path(self, name: str) -> pathlib.Path:
+        return self.root / f"{name}.bin"
+
+    def _committed(self, name: str) -> int:
+        """Count the bytes of a file which belong to the snapshot."""
+        return self._manifest["sizes"].get(name, 0)
+
+    # READING.
+
+    def __len__(self) -> int:
+        return self._manifest["rows"]
+
+    def column(self, name: str) -> np.ndarray:
+        """Memory-map a fixed-width column, read-only."""
+        with self._lock:
+            if (column := self._columns.get(name)) is not None:
+                return column
+
+            dtype, rows = _COLUMNS[name], len(self)
+
+            # Zero-length files cannot be mapped.
+            if rows == 0:
+                column = np.empty(0, dtype=dtype)
+            else:
+                column = np.memmap(self._path(name), dtype=dtype, mode="r", shape=(rows,))
+
+            self._columns[name] = column
+            return column
+
+    @property
+    def track_ids(self) -> np.ndarray:
+        return self.column("track_ids")
+
+    @property
+    def tempos(self) -> np.ndarray:
+        return self.column("tempos")
+
+    @property
+    def durations(self) -> np.ndarray:
+        return self.column("durations")
+
+    def vocabulary(self, name: str) -> Vocabulary:
+        """Load an artist, album or genre vocabulary."""
+        with self._lock:
+            if (vocabulary := self._vocabularies.get(name)) is not None:
+                return vocabulary
+
+            vocabulary = Vocabulary()
+
+            if size := self._committed(name):
+                with self._path(name).open("rb") as f:
+                    for line in f.read(size).splitlines():
+                        vocabulary.encode(json.loads(line))
+
+            self._vocabularies[name] = vocabulary
+            return vocabulary
+
+    def _title_at(self, row: int) -> str:
+        # The titles blob and its end offsets must come from the same commit.
+        with self._lock:
+            if self._titles is None:
+                size = self._committed("titles")
+                self._titles = np.empty(0, dtype=np.uint8) if size == 0 else np.memmap(self._path("titles"), dtype=np.uint8, mode="r", shape=(size,))
+
+            titles, ends = self._titles, self.column("title_ends")
+
+        start = 0 if row == 0 else int(ends[row - 1])
+        return titles[start: int(ends[row])].tobytes().decode("utf-8")
+
+    def _row(self, row: int) -> dict[str, Any]:
+        if not 0 <= row < len(self):
+            raise IndexError(f"row {row} is out of range for a snapshot of {len(self)} songs")
+
+        return {
+            "track_id": self.track_ids[row].decode("ascii"),
+            "title": self._title_at(row),
+            "artist": self.vocabulary("artists").decode(int(self.column("artist_codes")[row])),
+            "album": self.vocabulary("albums").decode(int(self.column("album_codes")[row])),
+            "tempo": int(self.tempos[row]),
+            "duration": float(self.durations[row]),
+            "genre": self.vocabulary("genres").decode(int(self.column("genre_codes")[row])),
+        }
+
+    @property
+    def positions(self) -> dict[SpotifyIDT, int]:
+        """Map each track to its latest row."""
+        with self._lock:
+            if self._positions is None:
+                self._positions = {track_id.decode("ascii"): row for row, track_id in enumerate(self.track_ids.tolist())}
+
+            return self._positions
+
+    def __contains__(self, track_id: SpotifyIDT) -> bool:
+        return track_id in self.positions
+
+    def song_at(self, row: int) -> Song:
+        """Build the Song stored in a row."""
+        return Song.from_trusted_rows([self._row(row)])[0]
+
+    def get_song(self, track_id: SpotifyIDT) -> Song:
+        """Build the latest Song stored for a track."""
+        return self.song_at(self.positions[track_id])
+
+    def latest_rows(self) -> list[int]:
+        """List the rows which hold the latest version of each track."""
+        return sorted(self.positions.values())
+
+    def to_songs(self, rows: Iterable[int] | None = None) -> list[Song]:
+        """Build Songs for the given rows, or the latest version of every track."""
+        rows = self.latest_rows() if rows is None else rows
+        return Song.from_trusted_rows(self._row(int(row)) for row in rows)
+
+    def __iter__(self) -> Iterator[Song]:
+        for row in self.latest_rows():
+            yield self.song_at(row)
+
+    def to_library(self) -> SongLibrary:
+        """Load the latest version of every track into a SongLibrary."""
+        return SongLibrary.from_songs(self.to_songs())
+
+    # WRITING.
+
+    def _open_for_append(self, name: str) -> Any:
+        """Open a file positioned just past its committed bytes, discarding anything after them."""
+        path = self._path(name)
+        f = path.open("r+b" if path.exists() else "w+b")
+        f.truncate(self._committed(name))
+        f.seek(0, os.SEEK_END)
+        return f
+
+    def _write(
+        self,
+        columns: dict[str, np.ndarray],
+        titles: list[bytes],
+        vocabularies: dict[str, Vocabulary],
+        known: dict[str, int],
+    ) -> dict[str, int]:
+        """Write new rows past the committed end of every file, returning the new file sizes."""
+        sizes = dict(self._manifest["sizes"])
+
+        for name, values in columns.items():
+            with self._open_for_append(name) as f:
+                f.write(values.tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+                sizes[name] = f.tell()
+
+        with self._open_for_append("titles") as f:
+            f.write(b"".join(titles))
+            f.flush()
+            os.fsync(f.fileno())
+            sizes["titles"] = f.tell()
+
+        for name, vocabulary in vocabularies.items():
+            with self._open_for_append(name) as f:
+                f.writelines(json.dumps(value).encode("utf-8") + b"\n" for value in vocabulary.values[known[name]:])
+                f.flush()
+                os.fsync(f.fileno())
+                sizes[name] = f.tell()
+
+        return sizes
+
+    def append(self, songs: Iterable[Song]) -> int:
+        """Add Songs to the end of the snapshot, returning how many were written."""
+        songs = list(songs)
+
+        if not songs:
+            return 0
+
+        with self._lock:
+            vocabularies = {name: self.vocabulary(name) for name in _VOCABULARIES}
+            known = {name: len(vocabulary) for name, vocabulary in vocabularies.items()}
+
+            titles = [song.title.encode("utf-8") for song in songs]
+            title_base = self._committed("titles")
+
+            columns = {
+                "track_ids": np.array([song.track_id.encode("ascii") for song in songs], dtype=_COLUMNS["track_ids"]),
+                "tempos": np.array([song.tempo for song in songs], dtype=_COLUMNS["tempos"]),
+                "durations": np.array([song.duration for song in songs], dtype=_COLUMNS["durations"]),
+                "artist_codes": np.array([vocabularies["artists"].encode(song.artist) for song in songs], dtype=_COLUMNS["artist_codes"]),
+                "album_codes": np.array([vocabularies["albums"].encode(song.album) for song in songs], dtype=_COLUMNS["album_codes"]),
+                "genre_codes": np.array([vocabularies["genres"].encode(song.genre) for song in songs], dtype=_COLUMNS["genre_codes"]),
+                "title_ends": (title_base + np.cumsum([len(title) for title in titles])).astype(_COLUMNS["title_ends"]),
+            }
+
+            try:
+                sizes = self._write(columns, titles, vocabularies, known)
+            except BaseException:
+                # The vocabularies hold values which never reached the disk.
+                self._vocabularies.clear()
+                raise
+
+            # COMMIT THE NEW ROWS BY REPLACING THE MANIFEST.
+            manifest = {**self._manifest, "rows": len(self) + len(songs), "sizes": sizes}
+            temp = self.root / f"{_MANIFEST}.{os.getpid()}.tmp"
+            temp.write_text(json.dumps(manifest, indent=2), encoding="utf-8")
+            os.replace(temp, self.root / _MANIFEST)
+
+            rows = len(self)
+            self._manifest = manifest
+
+            # Column maps are sized to the old row count, so map them again on next read. Readers
+            # hold the lock too, so none of them can cache a map between the commit and here.
+            self._columns.clear()
+            self._titles = None
+
+            if self._positions is not None:
+                # Publish a new map, readers may be iterating over the old one.
+                self._positions = self._positions | {song.track_id: rows + idx for idx, song in enumerate(songs)}
+
+        logger.debug(f"Appended {len(songs)} songs to snapshot '{self.root}'")
+        return len(songs)
+
+    def refresh(self) -> None:
+        """Pick up appends made by another process."""
+        with self._lock:
+            self._manifest = self._read_manifest()
+            self._columns.clear()
+            self._vocabularies.clear()
+            self._positions = None
+            self._titles = None
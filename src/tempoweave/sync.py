@@ -0,0 +1,267 @@
+from collections.abc import Iterable
+from typing import Any, Self
+
+from concurrent import futures
+import dataclasses
+import datetime as dt
+import json
+import logging
+import threading
+
+import sqlalchemy as sa
+
+from tempoplay.fetch import SongFetcher
+from tempoplay.schema import Song
+from tempoplay.types import SpotifyIDT, SpotifyURIT, SpotifyURLT
+
+logger = logging.getLogger(__name__)
+
+
+@dataclasses.dataclass
+class PlaylistSyncResult:
+    """Represents what changed in a playlist since it was last synced."""
+
+    playlist_id: SpotifyIDT
+    snapshot_id: str
+    changed: bool
+    added: list[SpotifyIDT] = dataclasses.field(default_factory=list)
+    removed: list[SpotifyIDT] = dataclasses.field(default_factory=list)
+    pending: list[futures.Future] = dataclasses.field(default_factory=list)
+    """Background fetches of tracks which have never been analyzed."""
+
+    def wait(self) -> None:
+        """Block until every background fetch has finished."""
+        futures.wait(self.pending)
+
+
+class PlaylistSync:
+    """
+    Keeps a library of Songs in step with a set of Spotify playlists.
+
+    Each playlist's snapshot_id and track IDs are stored after every sync. Spotify
+    changes the snapshot_id whenever a playlist is edited, so an unchanged playlist costs
+    a single request. A changed playlist is re-listed and diffed against its stored
+    tracks: removed songs leave the library (unless another synced playlist still holds
+    them) and only added tracks are fetched.
+
+    Tracks whose tempo is already known to a cheap tempo provider join the library
+    straight away; tracks which were never analyzed are fetched in the background. Give
+    the SongFetcher a SongSnapshot, so that a fresh process can rebuild the library of
+    an unchanged playlist without asking Spotify again.
+    """
+
+    def __init__(self, song_fetcher: SongFetcher, db_engine: sa.engine.Engine, background_workers: int = 4):
+        self.song_fetcher = song_fetcher
+        self.db_engine = db_engine
+        self.songs: dict[SpotifyIDT, Song] = {}
+        self._songs_lock = threading.Lock()
+        self._wanted: set[SpotifyIDT] = set()
+        self._background = futures.ThreadPoolExecutor(background_workers, thread_name_prefix="tempoweave-sync")
+        self._in_background: dict[SpotifyIDT, futures.Future] = {}
+
+        self.metadata = sa.MetaData()
+        self.table = sa.Table(
+            "playlist_syncs",
+            self.metadata,
+            sa.Column("playlist_id", sa.String, primary_key=True),
+            sa.Column("snapshot_id", sa.String, nullable=False),
+            sa.Column("track_ids", sa.Text, nullable=False),
+            sa.Column("synced_at", sa.DateTime, nullable=False),
+        )
+        self.metadata.create_all(self.db_engine)
+
+    def __enter__(self) -> Self:
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+    def close(self, wait: bool = False) -> None:
+        """
+        Stop fetching in the background. Tracks still queued are dropped, and analyzed by
+        the next sync instead, unless .wait is set.
+        """
+        self._background.shutdown(wait=wait, cancel_futures=not wait)
+
+    # STORED STATE.
+
+    def _load_state(self, playlist_id: SpotifyIDT) -> tuple[str, list[SpotifyIDT]] | None:
+        q = sa.select(self.table.c.snapshot_id, self.table.c.track_ids).where(self.table.c.playlist_id == playlist_id)
+
+        with self.db_engine.connect() as conn:
+            row = conn.execute(q).first()
+
+        return None if row is None else (row.snapshot_id, json.loads(row.track_ids))
+
+    def _save_state(self, playlist_id: SpotifyIDT, snapshot_id: str, track_ids: list[SpotifyIDT]) -> None:
+        row: dict[str, Any] = {
+            "playlist_id": playlist_id,
+            "snapshot_id": snapshot_id,
+            "track_ids": json.dumps(track_ids),
+            "synced_at": dt.datetime.now(tz=dt.UTC),
+        }
+
+        with self.db_engine.begin() as conn:
+            conn.execute(sa.delete(self.table).where(self.table.c.playlist_id == playlist_id))
+            conn.execute(sa.insert(self.table).values(**row))
+
+    def _tracks_held_elsewhere(self, playlist_id: SpotifyIDT) -> set[SpotifyIDT]:
+        """Collect the tracks of every other synced playlist."""
+        q = sa.select(self.table.c.track_ids).where(self.table.c.playlist_id != playlist_id)
+
+        with self.db_engine.connect() as conn:
+            return {track_id for row in conn.execute(q) for track_id in json.loads(row.track_ids)}
+
+    # FETCHING.
+
+    def _resolve(self, track_id: SpotifyIDT) -> Song | None:
+        """Find a Song without asking Spotify."""
+        if (song := self.songs.get(track_id)) is not None:
+            return song
+
+        snapshot = self.song_fetcher.snapshot
+
+        if snapshot is None or track_id not in snapshot:
+            return None
+
+        song = snapshot.get_song(track_id)
+
+        with self._songs_lock:
+            self.songs[track_id] = song
+
+        return song
+
+    def _analyze(self, track: dict[str, Any]) -> Song:
+        """Estimate the tempo of a track which no cheap provider knew, in the background."""
+        try:
+            if (tempo := self.song_fetcher.lookup_tempo(track)) is None:
+                raise RuntimeError(f"Could not estimate a tempo for '{track['id']}'")
+
+            song = self.song_fetcher.build_song(track, tempo=tempo)
+            self.song_fetcher.remember(song)
+            self.song_fetcher.flush_snapshot()
+
+            with self._songs_lock:
+                # The track may have left every synced playlist while it was analyzed.
+                if song.track_id in self._wanted:
+                    self.songs[song.track_id] = song
+
+            return song
+
+        except Exception as e:
+            logger.warning(f"Failed to analyze '{track['id']}' in the background: {e}")
+            raise
+
+        finally:
+            with self._songs_lock:
+                self._in_background.pop(track["id"], None)
+
+    def _fetch(self, track_ids: Iterable[SpotifyIDT]) -> list[futures.Future]:
+        """Bring tracks into the library, queueing any which still need analysis."""
+        track_ids = list(dict.fromkeys(track_ids))
+
+        with self._songs_lock:
+            self._wanted.update(track_ids)
+
+        missing = [track_id for track_id in track_ids if self._resolve(track_id) is None]
+        pending: list[futures.Future] = []
+
+        if not missing:
+            return pending
+
+        cheap_providers = [provider for provider in self.song_fetcher.tempo_providers if provider.cheap]
+
+        for track_id, track in self.song_fetcher.get_tracks(missing).items():
+            if track is None:
+                logger.warning(f"Could not find a Song for '{track_id}'")
+                continue
+
+            if (tempo := self.song_fetcher.lookup_tempo(track, cheap_providers)) is not None:
+                song = self.song_fetcher.build_song(track, tempo=tempo)
+                self.song_fetcher.remember(song)
+
+                with self._songs_lock:
+                    self.songs[track_id] = song
+
+                continue
+
+            with self._songs_lock:
+                if (future := self._in_background.get(track_id)) is None:
+                    future = self._in_background[track_id] = self._background.submit(self._analyze, track)
+
+            pending.append(future)
+
+        self.song_fetcher.flush_snapshot()
+        return pending
+
+    # SYNCING.
+
+    def sync(self, playlist_identity: SpotifyURIT | SpotifyURLT | SpotifyIDT) -> PlaylistSyncResult:
+        """Bring the library in step with a playlist, fetching as little as possible."""
+        playlist_id = self.song_fetcher.get_spotify_id(playlist_identity)
+
+        # 1. ASK SPOTIFY WHETHER THE PLAYLIST CHANGED AT ALL.
+        snapshot_id = self.song_fetcher.spotify.playlist(playlist_id, fields="snapshot_id")["snapshot_id"]
+        stored = self._load_state(playlist_id)
+
+        if stored is not None and stored[0] == snapshot_id:
+            # Nothing changed, but this process may not have the playlist's songs yet.
+            result = PlaylistSyncResult(playlist_id, snapshot_id, changed=False)
+            result.pending = self._fetch(stored[1])
+            return result
+
+        # 2. DIFF THE CURRENT TRACKS AGAINST THE ONES SEEN LAST TIME.
+        track_ids = list(self.song_fetcher.iter_playlist_track_ids(playlist_id))
+        previous = [] if stored is None else stored[1]
+        current, before = set(track_ids), set(previous)
+
+        result = PlaylistSyncResult(
+            playlist_id,
+            snapshot_id,
+            changed=True,
+            added=[track_id for track_id in dict.fromkeys(track_ids) if track_id not in before],
+            removed=[track_id for track_id in dict.fromkeys(previous) if track_id not in current],
+        )
+
+        self._save_state(playlist_id, snapshot_id, track_ids)
+
+        # 3. DROP REMOVED SONGS, UNLESS ANOTHER PLAYLIST STILL HOLDS THEM.
+        if result.removed:
+            held_elsewhere = self._tracks_held_elsewhere(playlist_id)
+
+            with self._songs_lock:
+                for track_id in result.removed:
+                    if track_id not in held_elsewhere:
+                        self._wanted.discard(track_id)
+                        self.songs.pop(track_id, None)
+
+        # 4. FETCH ADDED TRACKS, PLUS ANY THIS PROCESS HASN'T LOADED YET.
+        result.pending = self._fetch(track_ids)
+
+        logger.info(
+            f"Synced playlist '{playlist_id}': +{len(result.added)} -{len(result.removed)}, "
+            f"{len(result.pending)} tracks analyzing in the background"
+        )
+
+        return result
+
+    def sync_many(self, playlist_identities: Iterable[SpotifyURIT | SpotifyURLT | SpotifyIDT]) -> list[PlaylistSyncResult]:
+        """Sync many playlists, skipping (and logging) any which fail."""
+        results: list[PlaylistSyncResult] = []
+
+        for playlist_identity in playlist_identities:
+            try:
+                results.append(self.sync(playlist_identity))
+            except Exception as e:
+                logger.exception(f"Failed to sync playlist '{playlist_identity}': {e}")
+
+        return results
+
+    def songs_for(self, playlist_identity: SpotifyURIT | SpotifyURLT | SpotifyIDT) -> list[Song]:
+        """List the library's songs for a synced playlist, in playlist order."""
+        playlist_id = self.song_fetcher.get_spotify_id(playlist_identity)
+
+        if (stored := self._load_state(playlist_id)) is None:
+            raise RuntimeError(f"Playlist '{playlist_id}' has never been synced")
+
+        return [song for track_id in stored[1] if (song := self.songs.get(track_id)) is not None]
@@ -0,0 +1,165 @@
+from collections.abc import Sequence
+
+import dataclasses
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Onset frames and autocorrelation window, about 9 seconds at 22,050 Hz. A longer hop
+# leaves so few lags between 120 and 180 BPM that the half tempo often wins outright.
+HOP_LENGTH = 512
+WIN_LENGTH = 384
+
+
+@dataclasses.dataclass(frozen=True, slots=True)
+class TempoEstimate:
+    """Represents the tempo of a single waveform."""
+
+    bpm: float
+    """Most likely tempo in BPM."""
+
+    confidence: float
+    """Share of the (prior-weighted) tempogram energy at .bpm, between 0 and 1."""
+
+    half_bpm: float
+    """The half-tempo alternative."""
+
+    double_bpm: float
+    """The double-tempo alternative."""
+
+    half_strength: float
+    """Tempogram strength at .half_bpm, relative to .bpm."""
+
+    double_strength: float
+    """Tempogram strength at .double_bpm, relative to .bpm."""
+
+
+class TempoEngine:
+    """Estimates tempo for many waveforms at once."""
+
+    def __init__(
+        self,
+        sample_rate: int = 22_050,
+        start_bpm: float = 120.0,
+        std_bpm: float = 1.0,
+        min_bpm: float = 30.0,
+        max_bpm: float = 300.0,
+    ):
+        import librosa  # slow to import (numba), only load it once an engine is built.
+
+        self.sample_rate = sample_rate
+        self.hop_length = HOP_LENGTH
+        self.win_length = WIN_LENGTH
+        self.start_bpm = start_bpm
+        self.std_bpm = std_bpm
+        self.min_bpm = min_bpm
+        self.max_bpm = max_bpm
+
+        # These only depend on the configuration, so compute them once per engine.
+        self.frequencies = librosa.tempo_frequencies(self.win_length, hop_length=self.hop_length, sr=sample_rate)
+        self.valid = (self.frequencies >= min_bpm) & (self.frequencies <= max_bpm)
+        self.prior = np.where(self.valid, self._prior(self.frequencies), 0.0)
+
+    def _prior(self, bpm: np.ndarray) -> np.ndarray:
+        """Weigh tempos by a log-normal prior centred on .start_bpm."""
+        with np.errstate(divide="ignore"):
+            return np.exp(-0.5 * ((np.log2(bpm) - np.log2(self.start_bpm)) / self.std_bpm) ** 2)
+
+    def _stack(self, waveforms: Sequence[np.ndarray]) -> np.ndarray:
+        """Stack waveforms into a (batch, samples) array, zero-padding the short ones."""
+        n_samples = max(len(y) for y in waveforms)
+        stacked = np.zeros((len(waveforms), n_samples), dtype=np.float32)
+
+        for idx, y in enumerate(waveforms):
+            stacked[idx, : len(y)] = y
+
+        return stacked
+
+    def onset_envelopes(self, waveforms: Sequence[np.ndarray]) -> np.ndarray:
+        """Compute onset strength envelopes as a (batch, frames) array."""
+        import librosa
+
+        return librosa.onset.onset_strength(y=self._stack(waveforms), sr=self.sample_rate, hop_length=self.hop_length)
+
+    def estimate_from_onset_envelopes(self, onset_envelopes: np.ndarray) -> list[TempoEstimate]:
+        """Estimate tempo from a (batch, frames) array of onset envelopes."""
+        import librosa
+
+        tempogram = librosa.feature.tempogram(
+            onset_envelope=onset_envelopes,
+            sr=self.sample_rate,
+            hop_length=self.hop_length,
+            win_length=self.win_length,
+        )
+
+        # (batch, lags, frames) -> (batch, lags)
+        strength = np.clip(tempogram.mean(axis=-1), 0.0, None)
+        bpm, peak = self._interpolate_peaks(strength)
+        rows = np.arange(len(bpm))
+
+        # 1. PICK THE PEAK WHICH SCORES BEST UNDER THE PRIOR, BETWEEN LAGS RATHER THAN ON THEM.
+        in_range = (bpm >= self.min_bpm) & (bpm <= self.max_bpm)
+        weighted_peaks = np.where(in_range, peak * self._prior(bpm), 0.0)
+        best = weighted_peaks.argmax(axis=-1)
+        best_bpm, best_peak = bpm[rows, best], peak[rows, best]
+
+        total = (strength * self.prior).sum(axis=-1)
+        confidence = np.clip(np.divide(weighted_peaks[rows, best], total, out=np.zeros_like(total), where=total > 0), 0.0, 1.0)
+
+        # 2. READ THE HALF AND DOUBLE TEMPO ALTERNATIVES OFF THE SAME CURVE.
+        half_strength = np.divide(self._strength_at(strength, best_bpm / 2), best_peak, out=np.zeros_like(best_peak), where=best_peak > 0)
+        double_strength = np.divide(self._strength_at(strength, best_bpm * 2), best_peak, out=np.zeros_like(best_peak), where=best_peak > 0)
+
+        return [
+            TempoEstimate(
+                bpm=float(best_bpm[i]),
+                confidence=float(confidence[i]),
+                half_bpm=float(best_bpm[i] / 2),
+                double_bpm=float(best_bpm[i] * 2),
+                half_strength=float(half_strength[i]),
+                double_strength=float(double_strength[i]),
+            )
+            for i in rows
+        ]
+
+    def estimate(self, waveforms: Sequence[np.ndarray]) -> list[TempoEstimate]:
+        """Estimate tempo for every waveform in the batch."""
+        if not waveforms:
+            return []
+
+        return self.estimate_from_onset_envelopes(self.onset_envelopes(waveforms))
+
+    def _to_lag(self, bpm: np.ndarray) -> np.ndarray:
+        """Convert BPM to a (fractional) tempogram lag, in frames."""
+        return 60.0 * self.sample_rate / (self.hop_length * bpm)
+
+    def _interpolate_peaks(self, strength: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Locate every local peak of a (batch, lags) strength curve between its lags.
+
+        The lags sit 3-6 BPM apart at typical tempos, and a beat which falls between two
+        of them splits its energy across both. A parabola through each peak
+        and its neighbours recovers the fractional lag and the height of the true peak.
+        Returns (bpm, height) per lag, with a height of zero wherever there is no peak.
+        """
+        left, centre, right = strength[:, :-2], strength[:, 1:-1], strength[:, 2:]
+        is_peak = (centre > 0) & (centre >= left) & (centre > right)
+
+        curvature = left - 2 * centre + right
+        offset = np.divide(0.5 * (left - right), curvature, out=np.zeros_like(centre), where=curvature < 0)
+        offset = np.clip(offset, -0.5, 0.5)
+
+        lags = np.arange(1, strength.shape[-1] - 1) + offset
+        bpm = 60.0 * self.sample_rate / (self.hop_length * lags)
+        height = np.where(is_peak, centre - 0.25 * (left - right) * offset, 0.0)
+        return bpm, height
+
+    def _strength_at(self, strength: np.ndarray, bpm: np.ndarray) -> np.ndarray:
+        """Read each row of a (batch, lags) strength curve at a BPM, between lags if need be."""
+        lag = np.clip(self._to_lag(bpm), 1, strength.shape[-1] - 1)
+        lo = np.floor(lag).astype(np.int64)
+        hi = np.minimum(lo + 1, strength.shape[-1] - 1)
+        rows = np.arange(len(bpm))
+        return strength[rows, lo] + (lag - lo) * (strength[rows, hi] - strength[rows, lo])
@@ -1,9 +1,19 @@
-from typing import Annotated, TypedDict
+from typing import Annotated, Literal, TypedDict
 
 
 type SpotifyIDT = Annotated[str, "A base-62 identifier found at the end of the Spotify URI."]
 type SpotifyURIT = Annotated[str, "Takes the format 'spotify:<resource_type>:<spotify_id>'."]
 type SpotifyURLT = Annotated[str, "Takes the format 'http://open.spotify.com/<resource_type>/<spotify_id>'"]
+type EasingFunctionT = Literal[
+    "linear",
+    "ease_in",
+    "ease_out",
+    "ease_in_out",
+    "ease_in_cubic",
+    "ease_out_cubic",
+    "ease_in_out_cubic",
+    "step",
+]
 
 
 class SpotifyAuthInfoT(TypedDict):
@@ -19,5 +29,6 @@ __all__ = (
     "SpotifyIDT",
     "SpotifyURIT",
     "SpotifyURLT",
+    "EasingFunctionT",
     "SpotifyAuthInfoT",
 )
\ No newline at end of file
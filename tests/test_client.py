@@ -0,0 +1,138 @@
+from collections.abc import Iterator
+from typing import Any
+
+from concurrent import futures
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import threading
+import time
+
+import pytest
+
+from tempoplay.client import SpotifyClient
+from tempoplay.ratelimit import TokenBucket
+
+
+class FakeAuthManager:
+    """Hands out a fixed token, so the client never talks to accounts.spotify.com."""
+
+    def get_access_token(self, as_dict: bool = True) -> str:
+        return "token"
+
+
+class StubSpotify(ThreadingHTTPServer):
+    """A local stand-in for the Spotify Web API, answering from a script of responses per path."""
+
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), _StubHandler)
+        self.responses: dict[str, list[tuple[int, dict[str, str], float]]] = {}
+        self.requests: list[tuple[str, float]] = []
+        self.lock = threading.Lock()
+
+    @property
+    def api_prefix(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}/v1/"
+
+    def script(self, path: str, *responses: tuple[int, dict[str, str], float]) -> None:
+        """Queue (status, headers, delay) answers for a path; the last one repeats."""
+        self.responses[path] = list(responses)
+
+    def arrivals(self, path: str) -> list[float]:
+        with self.lock:
+            return [at for requested, at in self.requests if requested == path]
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    server: StubSpotify
+
+    def do_GET(self) -> None:
+        path = self.path.partition("?")[0]
+
+        with self.server.lock:
+            self.server.requests.append((path, time.monotonic()))
+            script = self.server.responses[path]
+            status, headers, delay = script.pop(0) if len(script) > 1 else script[0]
+
+        time.sleep(delay)
+        body = json.dumps({"id": path.rpartition("/")[2]} if status == 200 else {"error": {"status": status, "message": "stub"}}).encode()
+
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+
+        for name, value in headers.items():
+            self.send_header(name, value)
+
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args: Any) -> None:
+        pass
+
+
+@pytest.fixture
+def stub() -> Iterator[StubSpotify]:
+    server = StubSpotify()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    try:
+        yield server
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def _client(stub: StubSpotify, **kwargs: Any) -> SpotifyClient:
+    return SpotifyClient(auth_manager=FakeAuthManager(), api_prefix=stub.api_prefix, **kwargs)
+
+
+def test_429_is_retried_after_retry_after(stub):
+    stub.script("/v1/tracks/a", (429, {"Retry-After": "0.5"}, 0.0), (200, {}, 0.0))
+    client = _client(stub)
+
+    assert client.track("a") == {"id": "a"}
+
+    first, second = stub.arrivals("/v1/tracks/a")
+    assert second - first >= 0.5
+
+
+def test_429_pauses_the_shared_bucket_for_every_thread(stub):
+    stub.script("/v1/tracks/limited", (429, {"Retry-After": "0.5"}, 0.0), (200, {}, 0.0))
+    stub.script("/v1/tracks/other", (200, {}, 0.0))
+    bucket = TokenBucket(rate=100)
+    client, other_client = _client(stub, rate_limiter=bucket), _client(stub, rate_limiter=bucket)
+
+    with futures.ThreadPoolExecutor(2) as pool:
+        limited = pool.submit(client.track, "limited")
+
+        # Let the first answer land, then ask for something else through the same bucket.
+        while not stub.arrivals("/v1/tracks/limited"):
+            time.sleep(0.01)
+
+        time.sleep(0.05)
+        other = pool.submit(other_client.track, "other")
+
+        assert limited.result() == {"id": "limited"}
+        assert other.result() == {"id": "other"}
+
+    throttled_at = stub.arrivals("/v1/tracks/limited")[0]
+    assert stub.arrivals("/v1/tracks/other")[0] - throttled_at >= 0.45
+
+
+def test_identical_gets_in_flight_share_one_request(stub):
+    stub.script("/v1/tracks/slow", (200, {}, 0.3))
+    client = _client(stub)
+    start = threading.Barrier(8)
+
+    def fetch() -> Any:
+        start.wait()
+        return client.track("slow")
+
+    with futures.ThreadPoolExecutor(8) as pool:
+        results = list(pool.map(lambda _: fetch(), range(8)))
+
+    assert results == [{"id": "slow"}] * 8
+    assert len(stub.arrivals("/v1/tracks/slow")) == 1
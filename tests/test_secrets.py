@@ -0,0 +1,106 @@
+from typing import Any
+
+from concurrent import futures
+import threading
+import time
+
+from cryptography.fernet import Fernet
+import pytest
+import sqlalchemy as sa
+
+from tempoplay.secrets import GitHubActionsCacheHandler
+
+
+def _token(access_token: str, expires_in: float) -> dict[str, Any]:
+    return {
+        "access_token": access_token,
+        "token_type": "Bearer",
+        "expires_in": 3600,
+        "refresh_token": "refresh",
+        "scope": "playlist-modify-public",
+        "expires_at": int(time.time() + expires_in),
+    }
+
+
+@pytest.fixture
+def make_handler(tmp_path):
+    """Build handlers which share one token row, each through its own engine like separate workers."""
+    secret_key = Fernet.generate_key().decode()
+    engines: list[sa.engine.Engine] = []
+
+    def make(**options: Any) -> GitHubActionsCacheHandler:
+        engine = sa.create_engine(f"sqlite:///{tmp_path / 'tokens.db'}", connect_args={"timeout": 30})
+        engines.append(engine)
+        return GitHubActionsCacheHandler(secret_key, engine, poll_interval=0.02, **options)
+
+    yield make
+
+    for engine in engines:
+        engine.dispose()
+
+
+def _version(handler: GitHubActionsCacheHandler) -> int:
+    row = handler._read()
+    assert row is not None
+    return row.version
+
+
+def test_exactly_one_worker_refreshes_while_the_others_wait(make_handler):
+    handlers = [make_handler() for _ in range(6)]
+    handlers[0].save_token_to_cache(_token("stale", expires_in=10))
+    start = threading.Barrier(len(handlers))
+
+    def get_token(handler: GitHubActionsCacheHandler) -> str:
+        start.wait()
+        token = handler.get_cached_token()
+        assert token is not None
+
+        if token["expires_at"] == 0:
+            # This worker holds the lease, so it plays the auth manager and refreshes.
+            time.sleep(0.2)
+            handler.save_token_to_cache(_token("fresh", expires_in=3600))
+            return "claimed"
+
+        return token["access_token"]
+
+    with futures.ThreadPoolExecutor(len(handlers)) as pool:
+        results = list(pool.map(get_token, handlers))
+
+    assert sorted(results) == ["claimed"] + ["fresh"] * (len(handlers) - 1)
+    assert _version(handlers[0]) == 2
+
+
+def test_a_lease_which_is_never_released_lapses(make_handler):
+    dead, alive = make_handler(lease_seconds=0.3), make_handler()
+    dead.save_token_to_cache(_token("stale", expires_in=10))
+
+    # The first worker claims the refresh, then dies without saving a new token.
+    assert dead.get_cached_token()["expires_at"] == 0
+
+    start = time.perf_counter()
+    token = alive.get_cached_token()
+
+    assert token["expires_at"] == 0
+    assert time.perf_counter() - start >= 0.25
+
+
+def test_racing_first_tokens_end_in_an_update(make_handler):
+    handler, other = make_handler(), make_handler()
+    inserted = False
+
+    @sa.event.listens_for(handler.db_engine, "after_cursor_execute")
+    def insert_first(conn, cursor, statement, parameters, context, executemany) -> None:
+        nonlocal inserted
+
+        # Another worker stores the first token between this worker's UPDATE and its INSERT.
+        if statement.startswith("UPDATE auth_tokens") and not inserted:
+            inserted = True
+            other_token = _token("other", expires_in=3600)
+            values = {**other_token, "access_token": other._cipher.encrypt(b"other").decode(), "refresh_token": None}
+            conn.execute(sa.insert(handler.table).values(**values, name="spotify", version=1, updated_at=sa.func.now()))
+
+    handler.save_token_to_cache(_token("mine", expires_in=3600))
+
+    assert inserted
+    assert _version(handler) == 2
+    assert other.get_cached_token()["access_token"] == "mine"
@@ -0,0 +1,63 @@
+import threading
+
+from tempoplay.schema import Song
+from tempoplay.snapshot import SongSnapshot
+
+
+def _song(idx: int) -> Song:
+    return Song(
+        track_id=f"track{idx:017d}",
+        title=f"Song number {idx} " + "x" * (idx % 7),
+        artist=f"Artist {idx % 13}",
+        album=f"Album {idx % 29}",
+        tempo=100 + idx % 80,
+        duration=3.5,
+    )
+
+
+def test_append_and_read_back(tmp_path):
+    songs = [_song(idx) for idx in range(10)]
+    snapshot = SongSnapshot.from_songs(tmp_path, songs)
+
+    assert len(snapshot) == 10
+    assert list(snapshot) == songs
+    assert SongSnapshot(tmp_path).get_song(songs[3].track_id) == songs[3]
+
+
+def test_reads_stay_consistent_while_another_thread_appends(tmp_path):
+    snapshot = SongSnapshot.from_songs(tmp_path, [_song(0)])
+    batches, batch_size = 200, 25
+    done = threading.Event()
+    errors: list[BaseException] = []
+
+    def write() -> None:
+        try:
+            for batch in range(batches):
+                snapshot.append(_song(1 + batch * batch_size + idx) for idx in range(batch_size))
+        finally:
+            done.set()
+
+    def read() -> None:
+        try:
+            while not done.is_set():
+                # Any track the snapshot claims to hold must come back whole.
+                for track_id, row in list(snapshot.positions.items())[-batch_size:]:
+                    song = snapshot.song_at(row)
+                    assert (song.track_id, song.title) == (track_id, _song(int(track_id.removeprefix("track"))).title)
+
+                snapshot.latest_rows()
+        except BaseException as e:
+            errors.append(e)
+
+    readers = [threading.Thread(target=read) for _ in range(4)]
+    writer = threading.Thread(target=write)
+
+    for thread in (*readers, writer):
+        thread.start()
+
+    for thread in (writer, *readers):
+        thread.join()
+
+    assert not errors, errors[0]
+    assert len(snapshot) == 1 + batches * batch_size
+    assert SongSnapshot(tmp_path).to_songs() == [_song(idx) for idx in range(1 + batches * batch_size)]